@@ -12,6 +12,7 @@ from functools import wraps
 from datetime import datetime
 import resend
 from db import db, get_user_by_email, create_user, User
+from tracing import init_tracing
 from flask_login import current_user, login_required
 import smtplib
 from datetime import datetime, timedelta
@@ -50,6 +51,7 @@ else:
 # Also disable for requests
 requests.packages.urllib3.disable_warnings(requests.packages.urllib3.exceptions.InsecureRequestWarning)
 app = Flask(__name__)
+init_tracing(app, 'frontend')
 app.secret_key = os.environ.get('SECRET_KEY', 'dev_secret_key')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///users.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
@@ -1,83 +1,120 @@
-from flask import Flask, request, jsonify, Response
+from flask import Flask, request, jsonify, Response, g
 import os
 import requests
 import json
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import Pylance 
+from upstream import UpstreamClient
+from proxy import filter_headers, request_body, stream_response, upstream_path
+from routing import ROUTE_TABLE, SERVICE_URLS, SUPPORTED_METHODS
+from cache import CACHE_ENABLED, CachedResponse, ResponseCache, accept_variant, build_response, cache_key, make_etag
+from coalesce import COALESCE_ENABLED, SingleFlight, coalesce_key
+from health import HealthChecker
+from ratelimit import client_id, create_rate_limiter
+from compression import COMPRESSION_ENABLED, compress_response
+from retry import create_retrier
+from metrics import init_metrics, label_route
+from tracing import current_span, init_tracing
+from batch import BATCH_PATH, BATCH_WORKERS, BatchError, batch_result, parse_batch, sub_request_headers
 
 app = Flask(__name__)
+init_metrics(app)
+init_tracing(app, 'api_gateway')
 
-# Service URLs
-USER_SERVICE_URL = os.environ.get('USER_SERVICE_URL', 'http://localhost:5001')
-PRODUCT_SERVICE_URL = os.environ.get('PRODUCT_SERVICE_URL', 'http://localhost:5002')
-ORDER_SERVICE_URL = os.environ.get('ORDER_SERVICE_URL', 'http://localhost:5003')
-NOTIFICATION_SERVICE_URL = os.environ.get('NOTIFICATION_SERVICE_URL', 'http://localhost:5004')
-
-# Routes that don't require authentication
-PUBLIC_ROUTES = [
-    '/api/auth/login',
-    '/api/auth/register',
-    '/api/products',
-    '/api/categories',
-    '/api/products/'
-]
+# One pooled keep-alive client per upstream service
+UPSTREAMS = {
+    name: UpstreamClient.from_env(name, url) for name, url in SERVICE_URLS.items()
+}
+
+# Pass request and response bodies through without buffering them
+STREAM_PROXY = os.environ.get('GATEWAY_STREAM_PROXY', 'false').lower() in ('1', 'true', 'yes', 'on')
+
+# Response cache for anonymous GETs on public catalog routes
+EDGE_CACHE = ResponseCache() if CACHE_ENABLED else None
+
+# Identical concurrent GETs share one upstream request
+COALESCER = SingleFlight() if COALESCE_ENABLED else None
+
+# Parallel upstream probes, cached between rounds
+HEALTH = HealthChecker(UPSTREAMS)
+
+# Per-client token buckets (in-process or Redis backed)
+RATE_LIMITER = create_rate_limiter()
+
+# Retries with a shared budget, and optional hedging, for idempotent calls
+RETRIER = create_retrier()
+
+# Workers that run the sub-requests of /api/batch in parallel
+BATCH_EXECUTOR = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='batch')
 
 # Request forwarding logic
-@app.route('/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE'])
+@app.route('/<path:path>', methods=SUPPORTED_METHODS)
 def forward_request(path):
     full_path = f"/{path}"
     
-    # Determine which service to route to
-    if full_path.startswith('/api/auth') or full_path.startswith('/api/users'):
-        target_url = f"{USER_SERVICE_URL}{full_path}"
-    elif full_path.startswith('/api/products') or full_path.startswith('/api/categories') or full_path.startswith('/api/inventory'):
-        target_url = f"{PRODUCT_SERVICE_URL}{full_path}"
-    elif full_path.startswith('/api/orders'):
-        target_url = f"{ORDER_SERVICE_URL}{full_path}"
-    elif full_path.startswith('/api/notifications'):
-        target_url = f"{NOTIFICATION_SERVICE_URL}{full_path}"
-    else:
+    # Resolve upstream, allowed methods and auth rule in one lookup
+    route = ROUTE_TABLE.lookup(full_path)
+    if route is None:
         return jsonify({'message': 'Route not found'}), 404
+    if not route.allows(request.method):
+        return jsonify({'message': 'Method not supported'}), 405
+    upstream = UPSTREAMS[route.upstream]
+    label_route(route.prefix)
+    span = current_span()
+    if span is not None:
+        span.name = f"{request.method} {route.prefix}"
     
-    # Check authentication except for public routes
-    requires_auth = True
-    for route in PUBLIC_ROUTES:
-        if full_path.startswith(route) and request.method == 'GET':
-            requires_auth = False
-            break
+    if RATE_LIMITER is not None:
+        decision = RATE_LIMITER.check(client_id(request), route)
+        if decision is not None:
+            g.rate_limit_headers = decision.headers()
+            if not decision.allowed:
+                return jsonify({'message': 'Too many requests'}), 429
     
     headers = {}
     for key, value in request.headers:
         if key != 'Host':
             headers[key] = value
     
-    if requires_auth and 'Authorization' not in headers:
+    if route.requires_auth(request.method) and 'Authorization' not in headers:
         return jsonify({'message': 'Authentication required'}), 401
     
+    if (EDGE_CACHE is not None and route.cache_ttl and request.method == 'GET'
+            and not route.requires_auth('GET') and 'Authorization' not in headers):
+        return cached_request(upstream, route, full_path, headers)
+    
+    if STREAM_PROXY:
+        return stream_request(upstream, full_path)
+    
     # Proxy request to the appropriate service
     try:
         if request.method == 'GET':
-            response = requests.get(
-                target_url,
-                headers=headers,
-                params=request.args
-            )
+            response = upstream_get(upstream, upstream_path(request, full_path), headers)
         elif request.method == 'POST':
-            response = requests.post(
-                target_url,
+            response = upstream.request(
+                'POST',
+                full_path,
                 headers=headers,
                 json=request.get_json() if request.is_json else None,
                 data=request.form if not request.is_json else None
             )
         elif request.method == 'PUT':
-            response = requests.put(
-                target_url,
+            response = call_upstream(
+                upstream,
+                'PUT',
+                full_path,
                 headers=headers,
                 json=request.get_json() if request.is_json else None,
                 data=request.form if not request.is_json else None
             )
         elif request.method == 'DELETE':
-            response = requests.delete(
-                target_url,
+            response = call_upstream(
+                upstream,
+                'DELETE',
+                full_path,
                 headers=headers
             )
         else:
@@ -94,39 +131,195 @@ def forward_request(path):
         print(f"Error forwarding request: {str(e)}")
         return jsonify({'message': 'Service unavailable'}), 503
 
-# Health check endpoint
-@app.route('/health', methods=['GET'])
-def health_check():
-    health_status = {
-        'status': 'healthy',
-        'services': {}
-    }
+def stream_request(upstream, full_path):
+    headers = dict(filter_headers(request.headers.items(), drop=['Host']))
+    # Without this, requests would ask for gzip on the client's behalf
+    headers.setdefault('Accept-Encoding', 'identity')
+    
+    try:
+        response = call_upstream(
+            upstream,
+            request.method,
+            upstream_path(request, full_path),
+            # A streamed request body can't be sent twice
+            retry=request.method == 'GET',
+            headers=headers,
+            data=request_body(request),
+            stream=True
+        )
+    except requests.exceptions.RequestException as e:
+        print(f"Error forwarding request: {str(e)}")
+        return jsonify({'message': 'Service unavailable'}), 503
     
-    # Check health of all services
-    services = {
-        'user': USER_SERVICE_URL,
-        'product': PRODUCT_SERVICE_URL,
-        'order': ORDER_SERVICE_URL,
-        'notification': NOTIFICATION_SERVICE_URL
-    }
+    return stream_response(response)
+
+def call_upstream(upstream, method, target, retry=True, **kwargs):
+    if RETRIER is None or not retry:
+        return upstream.request(method, target, **kwargs)
+    return RETRIER.call(upstream, method, target, **kwargs)
+
+def upstream_get(upstream, target, headers):
+    # Buffered GET, shared with any identical request already in flight
+    if COALESCER is None:
+        return call_upstream(upstream, 'GET', target, headers=headers)
+    response, _ = COALESCER.do(
+        coalesce_key('GET', target, headers),
+        lambda: call_upstream(upstream, 'GET', target, headers=headers)
+    )
+    return response
+
+def fetch_for_cache(upstream, route, target, headers):
+    # Conditional headers are for the gateway to answer, not the upstream
+    headers = {key: value for key, value in headers.items()
+               if key.lower() not in ('if-none-match', 'if-modified-since')}
+    response = upstream_get(upstream, target, headers)
+    if response.status_code != 200:
+        return None, response
     
-    all_healthy = True
+    # requests has already decoded the body, so length and encoding change
+    cached_headers = filter_headers(
+        response.headers.items(),
+        drop=['Content-Length', 'Content-Encoding', 'Date', 'Server', 'ETag', 'Cache-Control', 'Age']
+    )
+    entry = CachedResponse(
+        response.status_code,
+        cached_headers,
+        response.content,
+        response.headers.get('ETag') or make_etag(response.content),
+        route.cache_ttl,
+        route.stale_ttl
+    )
+    return entry, response
+
+def refresh_cache(upstream, route, key, target, headers):
+    try:
+        entry, _ = fetch_for_cache(upstream, route, target, headers)
+        if entry is not None:
+            EDGE_CACHE.put(key, entry)
+    except requests.exceptions.RequestException as e:
+        print(f"Error refreshing cached response: {str(e)}")
+    finally:
+        EDGE_CACHE.end_refresh(key)
+
+def cached_request(upstream, route, full_path, headers):
+    # Upstreams answering in another format for some Accept get their own entry
+    key = cache_key(full_path, request.query_string, accept_variant(request.headers.get('Accept')))
+    target = upstream_path(request, full_path)
+    now = time.time()
+    entry = EDGE_CACHE.get(key)
     
-    for name, url in services.items():
+    if entry is not None and entry.is_fresh(now):
+        state = 'HIT'
+        EDGE_CACHE.count('hits')
+    elif entry is not None and entry.is_usable(now):
+        # Serve the stale copy now and revalidate in the background
+        state = 'STALE'
+        EDGE_CACHE.count('stale_hits')
+        if EDGE_CACHE.begin_refresh(key):
+            threading.Thread(
+                target=refresh_cache,
+                args=(upstream, route, key, target, headers),
+                daemon=True
+            ).start()
+    else:
+        state = 'MISS'
+        EDGE_CACHE.count('misses')
         try:
-            response = requests.get(f"{url}/health", timeout=2)
-            status = response.status_code == 200
-            health_status['services'][name] = 'healthy' if status else 'unhealthy'
-            if not status:
-                all_healthy = False
-        except:
-            health_status['services'][name] = 'unavailable'
-            all_healthy = False
+            entry, response = fetch_for_cache(upstream, route, target, headers)
+        except requests.exceptions.RequestException as e:
+            print(f"Error forwarding request: {str(e)}")
+            return jsonify({'message': 'Service unavailable'}), 503
+        if entry is None:
+            return Response(
+                response.content,
+                status=response.status_code,
+                content_type=response.headers.get('Content-Type', 'application/json')
+            )
+        EDGE_CACHE.put(key, entry)
     
-    if not all_healthy:
-        health_status['status'] = 'degraded'
+    result = build_response(entry, request.headers.get('If-None-Match'), state, now)
+    g.cache_entry = entry
+    g.cache_key = key
+    if result.status_code == 304:
+        EDGE_CACHE.count('not_modified')
+    return result
+
+@app.after_request
+def add_rate_limit_headers(response):
+    for key, value in g.get('rate_limit_headers', {}).items():
+        response.headers[key] = value
+    return response
+
+@app.after_request
+def negotiate_compression(response):
+    if not COMPRESSION_ENABLED:
+        return response
+    entry = g.get('cache_entry')
+    if entry is None:
+        return compress_response(response, request.headers.get('Accept-Encoding'))
+    # Compressed copies count towards the cache's size
+    key = g.cache_key
+    return compress_response(
+        response,
+        request.headers.get('Accept-Encoding'),
+        encoded=entry.encoded,
+        store=lambda encoding, body: EDGE_CACHE.add_encoded(key, entry, encoding, body)
+    )
+
+def run_sub_request(item, headers, remote_addr):
+    # Dispatch through the app so each item gets routing, auth, caching
+    # and coalescing exactly like a standalone request
+    path, _, query = item['path'].partition('?')
+    with app.test_request_context(
+        path,
+        method=item['method'],
+        query_string=query,
+        headers=headers,
+        json=item['body'],
+        environ_base={'REMOTE_ADDR': remote_addr}
+    ):
+        response = app.full_dispatch_request()
+        try:
+            return batch_result(item, response)
+        finally:
+            response.close()
+
+# Composite endpoint: several API calls in one round trip
+@app.route(BATCH_PATH, methods=['POST'])
+def batch_request():
+    try:
+        items = parse_batch(request.get_json(silent=True))
+    except BatchError as e:
+        return jsonify({'message': str(e)}), 400
     
-    return jsonify(health_status), 200
+    futures = [
+        BATCH_EXECUTOR.submit(
+            # Sub-requests show up in the trace as children of the batch
+            contextvars.copy_context().run,
+            run_sub_request,
+            item,
+            sub_request_headers(request.headers.items(), item),
+            request.remote_addr
+        )
+        for item in items
+    ]
+    return jsonify({'responses': [future.result() for future in futures]}), 200
+
+# Health check endpoint
+@app.route('/health', methods=['GET'])
+def health_check():
+    return jsonify(HEALTH.status()), 200
+
+# Gateway internals: connection pools, cache, coalescing, rate limit and retry counters
+@app.route('/gateway/stats', methods=['GET'])
+def gateway_stats():
+    return jsonify({
+        'upstreams': {name: upstream.stats() for name, upstream in UPSTREAMS.items()},
+        'cache': EDGE_CACHE.stats() if EDGE_CACHE is not None else None,
+        'coalescing': COALESCER.stats() if COALESCER is not None else None,
+        'rate_limit': RATE_LIMITER.stats() if RATE_LIMITER is not None else None,
+        'retries': RETRIER.stats() if RETRIER is not None else None
+    }), 200
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
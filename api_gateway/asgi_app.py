@@ -0,0 +1,233 @@
+import asyncio
+import json
+import os
+import time
+
+import aiohttp
+import requests
+
+from balancer import LoadBalancer, parse_instances
+from health import HealthChecker
+from proxy import filter_headers
+from routing import ROUTE_TABLE, SERVICE_URLS, SUPPORTED_METHODS
+from upstream import balancer_settings, upstream_settings
+
+# asyncio gateway engine. Same routing table, public routes and /health
+# response as app.py, but upstream calls don't hold a worker while in flight:
+#
+#   uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+
+# Connection limits per upstream; many in-flight requests share these sockets
+MAX_CONNECTIONS = int(os.environ.get('ASYNC_UPSTREAM_MAX_CONNECTIONS', 1000))
+KEEPALIVE_TIMEOUT = float(os.environ.get('ASYNC_UPSTREAM_KEEPALIVE_TIMEOUT', 15))
+
+
+def _make_client(name):
+    settings = upstream_settings(name)
+    connector = aiohttp.TCPConnector(
+        limit=MAX_CONNECTIONS,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+        force_close=not settings['keepalive']
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(
+            sock_connect=settings['connect_timeout'],
+            sock_read=settings['read_timeout']
+        ),
+        # Bodies are relayed as-is, Content-Encoding included
+        auto_decompress=False
+    )
+
+
+class _HealthProbe:
+    # What HealthChecker needs of an upstream: its balancer, and a GET of one
+    # instance. Probes run on the checker's threads, off the event loop.
+
+    def __init__(self, balancer):
+        self.balancer = balancer
+        self.session = requests.Session()
+
+    def request(self, method, path, guard=True, instance=None, **kwargs):
+        return self.session.request(method, f"{instance.url}{path}", **kwargs)
+
+
+async def _send_json(send, status, payload):
+    body = json.dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode('latin-1'))
+        ]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _request_body(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+        chunk = message.get('body', b'')
+        if chunk:
+            yield chunk
+        if not message.get('more_body', False):
+            return
+
+
+class AsyncGateway:
+    def __init__(self, service_urls):
+        self.service_urls = dict(service_urls)
+        self.clients = {}
+        self.balancers = {
+            name: LoadBalancer(parse_instances(url), **balancer_settings(name))
+            for name, url in self.service_urls.items()
+        }
+        self.in_flight = {name: 0 for name in self.service_urls}
+        self.requests = {name: 0 for name in self.service_urls}
+        # Same cached, parallel checks (and payload) as app.py
+        self.health_checker = HealthChecker(
+            {name: _HealthProbe(balancer) for name, balancer in self.balancers.items()}
+        )
+
+    def client(self, name):
+        if name not in self.clients:
+            self.clients[name] = _make_client(name)
+        return self.clients[name]
+
+    async def close(self):
+        clients, self.clients = self.clients, {}
+        await asyncio.gather(*(client.close() for client in clients.values()))
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            if scope['path'] == '/health' and scope['method'] == 'GET':
+                await _send_json(send, 200, await self.health())
+            elif scope['path'] == '/gateway/stats' and scope['method'] == 'GET':
+                await _send_json(send, 200, self.stats())
+            else:
+                await self.forward(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                for name in self.service_urls:
+                    self.client(name)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def forward(self, scope, receive, send):
+        full_path = scope['path']
+        method = scope['method']
+
+        if method not in SUPPORTED_METHODS:
+            await _send_json(send, 405, {'message': 'Method not supported'})
+            return
+
+        route = ROUTE_TABLE.lookup(full_path)
+        if route is None:
+            await _send_json(send, 404, {'message': 'Route not found'})
+            return
+        if not route.allows(method):
+            await _send_json(send, 405, {'message': 'Method not supported'})
+            return
+        upstream_name = route.upstream
+
+        headers = filter_headers(
+            [(key.decode('latin-1'), value.decode('latin-1')) for key, value in scope['headers']],
+            drop=['Host']
+        )
+        header_names = {key.lower() for key, _ in headers}
+
+        if route.requires_auth(method) and 'authorization' not in header_names:
+            await _send_json(send, 401, {'message': 'Authentication required'})
+            return
+
+        # Without this, aiohttp would ask for gzip on the client's behalf
+        if 'accept-encoding' not in header_names:
+            headers.append(('Accept-Encoding', 'identity'))
+
+        target = full_path
+        if scope.get('query_string'):
+            target = f"{full_path}?{scope['query_string'].decode('latin-1')}"
+
+        has_body = 'content-length' in header_names or any(
+            key.lower() == b'transfer-encoding' for key, _ in scope['headers']
+        )
+        balancer = self.balancers[upstream_name]
+        instance = balancer.acquire()
+        start = time.monotonic()
+        success = False
+        self.in_flight[upstream_name] += 1
+        self.requests[upstream_name] += 1
+        try:
+            try:
+                response = await self.client(upstream_name).request(
+                    method,
+                    f"{instance.url}{target}",
+                    headers=headers,
+                    data=_request_body(receive) if has_body else None,
+                    allow_redirects=False
+                )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"Error forwarding request: {str(e)}")
+                await _send_json(send, 503, {'message': 'Service unavailable'})
+                return
+            success = response.status < 500
+
+            try:
+                # The ASGI server sets its own Date and Server headers
+                response_headers = filter_headers(
+                    ((key.decode('latin-1'), value.decode('latin-1'))
+                     for key, value in response.raw_headers),
+                    drop=['Date', 'Server']
+                )
+                await send({
+                    'type': 'http.response.start',
+                    'status': response.status,
+                    'headers': [
+                        (key.encode('latin-1'), value.encode('latin-1'))
+                        for key, value in response_headers
+                    ]
+                })
+                async for chunk in response.content.iter_any():
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                await send({'type': 'http.response.body', 'body': b''})
+            finally:
+                response.release()
+        finally:
+            self.in_flight[upstream_name] -= 1
+            balancer.release(instance, success, time.monotonic() - start)
+
+    async def health(self):
+        # A stale or missing result blocks on a probe round, so off the loop
+        return await asyncio.get_running_loop().run_in_executor(None, self.health_checker.status)
+
+    def stats(self):
+        return {
+            'upstreams': {
+                name: {
+                    'strategy': self.balancers[name].strategy,
+                    'instances': self.balancers[name].stats(),
+                    'max_connections': MAX_CONNECTIONS,
+                    'requests': self.requests[name],
+                    'in_flight': self.in_flight[name]
+                }
+                for name in self.service_urls
+            }
+        }
+
+
+app = AsyncGateway(SERVICE_URLS)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=5000)
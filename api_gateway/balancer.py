@@ -0,0 +1,137 @@
+import itertools
+import random
+import threading
+import time
+
+STRATEGIES = ('round_robin', 'least_outstanding', 'p2c')
+
+# Weight of the newest sample in the moving latency average
+EWMA_ALPHA = 0.3
+
+# Latency sample recorded for a failed call, so instances that fail fast
+# don't look like the quickest ones
+FAILURE_PENALTY = 1.0
+
+
+def parse_instances(value):
+    """Split a comma separated service URL setting into instance URLs."""
+    return [url.strip().rstrip('/') for url in value.split(',') if url.strip()]
+
+
+class Instance:
+    __slots__ = ('url', 'outstanding', 'requests', 'failures', 'consecutive_failures',
+                 'ejected_until', 'ewma_latency', 'healthy')
+
+    def __init__(self, url):
+        self.url = url
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.ewma_latency = 0.0
+        self.healthy = True
+
+    def available(self, now):
+        return self.healthy and now >= self.ejected_until
+
+    def stats(self, now):
+        return {
+            'url': self.url,
+            'outstanding': self.outstanding,
+            'requests': self.requests,
+            'failures': self.failures,
+            'ewma_ms': round(self.ewma_latency * 1000, 1),
+            'healthy': self.healthy,
+            'ejected': now < self.ejected_until
+        }
+
+
+def _cost(instance):
+    return ((instance.outstanding + 1) * instance.ewma_latency, instance.outstanding)
+
+
+class LoadBalancer:
+    """Picks an upstream instance per request.
+
+    Instances are ejected for eject_seconds after eject_after consecutive
+    failed calls, and while their last health probe failed. If every
+    instance is out, all of them are used again rather than failing outright.
+    """
+
+    def __init__(self, urls, strategy='p2c', eject_after=5, eject_seconds=30.0):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown load balancing strategy '{strategy}'")
+        if not urls:
+            raise ValueError('At least one instance URL is required')
+        self.instances = [Instance(url) for url in urls]
+        self.strategy = strategy
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def _candidates(self, now):
+        candidates = [instance for instance in self.instances if instance.available(now)]
+        return candidates or self.instances
+
+    def _choose(self, candidates):
+        if len(candidates) == 1:
+            return candidates[0]
+        if self.strategy == 'round_robin':
+            return candidates[next(self._counter) % len(candidates)]
+        if self.strategy == 'least_outstanding':
+            fewest = min(instance.outstanding for instance in candidates)
+            return random.choice([instance for instance in candidates if instance.outstanding == fewest])
+        # Power of two choices: of two random instances, the one with the
+        # lower expected wait (queued requests times average latency)
+        first, second = random.sample(candidates, 2)
+        return first if _cost(first) <= _cost(second) else second
+
+    def acquire(self, avoid=None):
+        """Pick an instance and count the request as outstanding on it.
+        Instances in avoid are only used when there is no other choice."""
+        with self._lock:
+            candidates = self._candidates(time.monotonic())
+            if avoid:
+                candidates = [instance for instance in candidates if instance not in avoid] or candidates
+            instance = self._choose(candidates)
+            instance.outstanding += 1
+            instance.requests += 1
+            return instance
+
+    def release(self, instance, success, duration):
+        with self._lock:
+            instance.outstanding -= 1
+            if not success:
+                duration = max(duration, FAILURE_PENALTY)
+            if instance.ewma_latency:
+                instance.ewma_latency += EWMA_ALPHA * (duration - instance.ewma_latency)
+            else:
+                instance.ewma_latency = duration
+            if success:
+                instance.consecutive_failures = 0
+                return
+            instance.failures += 1
+            instance.consecutive_failures += 1
+            if self.eject_after and instance.consecutive_failures >= self.eject_after:
+                instance.ejected_until = time.monotonic() + self.eject_seconds
+                instance.consecutive_failures = 0
+
+    def mark_health(self, instance, healthy):
+        with self._lock:
+            instance.healthy = healthy
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return [instance.stats(now) for instance in self.instances]
+
+
+def service_status(statuses):
+    """Combine per-instance probe results into one status for the service."""
+    if 'healthy' in statuses:
+        return 'healthy'
+    if 'unhealthy' in statuses:
+        return 'unhealthy'
+    return 'unavailable'
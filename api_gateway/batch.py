@@ -0,0 +1,95 @@
+import json
+import os
+
+from routing import SUPPORTED_METHODS
+
+# POST /api/batch runs several API calls in one round trip:
+#
+#   {"requests": [{"id": "products", "method": "GET", "path": "/api/products?page=1"},
+#                 {"id": "orders", "method": "GET", "path": "/api/orders?per_page=5"}]}
+#
+# Each item goes through the normal gateway pipeline with the caller's
+# headers (including Authorization) and gets its own status in the reply.
+BATCH_PATH = '/api/batch'
+BATCH_MAX_REQUESTS = int(os.environ.get('GATEWAY_BATCH_MAX_REQUESTS', 20))
+BATCH_WORKERS = int(os.environ.get('GATEWAY_BATCH_WORKERS', 16))
+
+# Outer request headers that describe the batch body, not the sub-requests.
+# Accept-Encoding applies to the batch reply as a whole; sub-responses have
+# to stay uncompressed so they can be embedded in it.
+BATCH_DROP_HEADERS = frozenset(['host', 'content-length', 'content-type', 'transfer-encoding',
+                                'accept-encoding'])
+
+
+class BatchError(ValueError):
+    pass
+
+
+def parse_batch(data):
+    """Validate a batch body and return its items as dicts."""
+    if not isinstance(data, dict) or not isinstance(data.get('requests'), list):
+        raise BatchError("Body must be an object with a 'requests' list")
+
+    items = data['requests']
+    if not items:
+        raise BatchError('No requests in batch')
+    if len(items) > BATCH_MAX_REQUESTS:
+        raise BatchError(f"At most {BATCH_MAX_REQUESTS} requests per batch")
+
+    parsed = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+            raise BatchError(f"Request {index} needs a 'path'")
+        method = str(item.get('method', 'GET')).upper()
+        path = item['path']
+        if method not in SUPPORTED_METHODS:
+            raise BatchError(f"Request {index} uses unsupported method {method}")
+        if not path.startswith('/api/') or path.split('?', 1)[0].rstrip('/') == BATCH_PATH:
+            raise BatchError(f"Request {index} has an invalid path")
+        headers = item.get('headers') or {}
+        if not isinstance(headers, dict):
+            raise BatchError(f"Request {index} has invalid headers")
+        parsed.append({
+            'id': item.get('id', index),
+            'method': method,
+            'path': path,
+            'headers': {str(key): str(value) for key, value in headers.items()},
+            'body': item.get('body')
+        })
+    return parsed
+
+
+def sub_request_headers(outer_headers, item):
+    headers = {
+        key: value for key, value in outer_headers
+        if key.lower() not in BATCH_DROP_HEADERS
+    }
+    headers.update(item['headers'])
+    return headers
+
+
+def batch_result(item, response):
+    """Per-item entry of the batch reply for a Flask response."""
+    # Streamed proxy responses have to be collected here
+    response.direct_passthrough = False
+    body = response.get_data()
+    content_type = response.headers.get('Content-Type', '')
+    if 'json' in content_type and body:
+        try:
+            body = json.loads(body)
+        except ValueError:
+            body = body.decode('utf-8', 'replace')
+    else:
+        body = body.decode('utf-8', 'replace') if body else None
+
+    headers = {}
+    for name in ('Content-Type', 'ETag', 'Cache-Control', 'X-Cache'):
+        if name in response.headers:
+            headers[name] = response.headers[name]
+
+    return {
+        'id': item['id'],
+        'status': response.status_code,
+        'headers': headers,
+        'body': body
+    }
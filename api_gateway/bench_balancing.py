@@ -0,0 +1,56 @@
+import argparse
+import sys
+
+from balancer import STRATEGIES
+from bench_common import free_port, load, print_row, start_process, start_stub, upstream_env
+
+# Tail latency of each load balancing strategy over product instances of
+# uneven speed (two fast, one slow by default):
+#
+#   python bench_balancing.py --delays 0.005 0.005 0.1 --concurrency 16
+
+
+def run_gateway(port, env):
+    code = f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)"
+    return start_process([sys.executable, '-c', code], port, env)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare gateway load balancing strategies')
+    parser.add_argument('--delays', type=float, nargs='+', default=[0.005, 0.005, 0.1],
+                        help='latency of each stub instance in seconds')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+
+    stubs = [start_stub(delay) for delay in args.delays]
+    instances = ','.join(url for _, url in stubs)
+    try:
+        for strategy in STRATEGIES:
+            env = upstream_env(instances)
+            env.update({
+                'UPSTREAM_LB_STRATEGY': strategy,
+                # Measure the balancer alone, without caching or coalescing
+                'GATEWAY_CACHE_ENABLED': 'false',
+                'GATEWAY_COALESCE_ENABLED': 'false',
+                'GATEWAY_RATE_LIMIT_ENABLED': 'false',
+                'UPSTREAM_MAX_IN_FLIGHT': '0',
+                'BREAKER_SLOW_CALL_SECONDS': '0'
+            })
+            port = free_port()
+            gateway = run_gateway(port, env)
+            try:
+                url = f"http://127.0.0.1:{port}/api/products?page=1"
+                load(url, 100, args.concurrency)
+                print_row(strategy, load(url, args.requests, args.concurrency))
+            finally:
+                gateway.terminate()
+                gateway.wait()
+    finally:
+        for stub, _ in stubs:
+            stub.terminate()
+            stub.wait()
+
+
+if __name__ == '__main__':
+    main()
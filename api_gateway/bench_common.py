@@ -0,0 +1,175 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+# Helpers shared by the gateway benchmarks: a stub upstream service,
+# launching gateway processes and an async load generator
+
+GATEWAY_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def _handle_stub(reader, writer, delay, body, slow_ratio=0.0, slow_delay=0.0, status=200):
+    try:
+        while True:
+            head = await reader.readuntil(b'\r\n\r\n')
+            length = 0
+            for line in head.split(b'\r\n')[1:]:
+                name, _, value = line.partition(b':')
+                if name.strip().lower() == b'content-length':
+                    length = int(value.strip())
+            if length:
+                await reader.readexactly(length)
+            if slow_ratio and random.random() < slow_ratio:
+                await asyncio.sleep(slow_delay)
+            elif delay:
+                await asyncio.sleep(delay)
+            writer.write(
+                b'HTTP/1.1 ' + str(status).encode() + b' Stub\r\n'
+                b'Content-Type: application/json\r\n'
+                b'Content-Length: ' + str(len(body)).encode() + b'\r\n\r\n' + body
+            )
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+def run_stub(port, delay, size, slow_ratio=0.0, slow_delay=0.0, status=200):
+    body = json.dumps({'items': ['x' * 64] * max(size // 70, 1)}).encode()
+
+    async def main():
+        server = await asyncio.start_server(
+            lambda r, w: _handle_stub(r, w, delay, body, slow_ratio, slow_delay, status),
+            '127.0.0.1', port, backlog=4096
+        )
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(main())
+
+
+def wait_for_port(port, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Nothing listening on port {port}")
+
+
+def start_process(args, port, env=None):
+    process = subprocess.Popen(
+        args,
+        cwd=GATEWAY_DIR,
+        env={**os.environ, **(env or {})},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    wait_for_port(port)
+    return process
+
+
+def start_stub(delay=0.0, size=512, slow_ratio=0.0, slow_delay=0.0, status=200):
+    """Start a stub upstream in its own process; returns (process, url).
+    A slow_ratio share of its requests take slow_delay instead of delay."""
+    port = free_port()
+    process = start_process(
+        [sys.executable, __file__, '--port', str(port), '--delay', str(delay), '--size', str(size),
+         '--slow-ratio', str(slow_ratio), '--slow-delay', str(slow_delay), '--status', str(status)],
+        port
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+def upstream_env(url):
+    """Environment pointing every gateway upstream at url."""
+    return {
+        'USER_SERVICE_URL': url,
+        'PRODUCT_SERVICE_URL': url,
+        'ORDER_SERVICE_URL': url,
+        'NOTIFICATION_SERVICE_URL': url
+    }
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+async def _load(url, total, concurrency, headers):
+    import aiohttp
+
+    latencies = []
+    errors = 0
+    remaining = iter(range(total))
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async def worker():
+            nonlocal errors
+            for _ in remaining:
+                start = time.perf_counter()
+                try:
+                    async with session.get(url, headers=headers) as response:
+                        await response.read()
+                        if response.status != 200:
+                            errors += 1
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        'requests': total,
+        'errors': errors,
+        'rps': total / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000
+    }
+
+
+def load(url, total, concurrency, headers=None):
+    """Send total GETs to url with the given concurrency and summarize latency."""
+    return asyncio.run(_load(url, total, concurrency, headers or {}))
+
+
+def print_row(label, result):
+    print(
+        f"{label:<28} {result['rps']:>9.1f} req/s  "
+        f"p50 {result['p50_ms']:>8.1f} ms  p95 {result['p95_ms']:>8.1f} ms  "
+        f"p99 {result['p99_ms']:>8.1f} ms  errors {result['errors']}"
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stub upstream service')
+    parser.add_argument('--port', type=int, required=True)
+    parser.add_argument('--delay', type=float, default=0.0)
+    parser.add_argument('--size', type=int, default=512)
+    parser.add_argument('--slow-ratio', type=float, default=0.0)
+    parser.add_argument('--slow-delay', type=float, default=0.0)
+    parser.add_argument('--status', type=int, default=200)
+    args = parser.parse_args()
+    run_stub(args.port, args.delay, args.size, args.slow_ratio, args.slow_delay, args.status)
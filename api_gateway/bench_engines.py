@@ -0,0 +1,62 @@
+import argparse
+import sys
+
+from bench_common import free_port, load, print_row, start_process, start_stub, upstream_env
+
+# Compares the Flask gateway (app.py) with the asyncio gateway (asgi_app.py)
+# in front of a stub upstream that takes --delay seconds per request:
+#
+#   python bench_engines.py --delay 0.05 --concurrency 200 --requests 5000
+
+
+def run_flask(port, env):
+    code = f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)"
+    return start_process([sys.executable, '-c', code], port, env)
+
+
+def run_asgi(port, env):
+    args = [
+        sys.executable, '-m', 'uvicorn', 'asgi_app:app',
+        '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning'
+    ]
+    return start_process(args, port, env)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the Flask and asyncio gateway engines')
+    parser.add_argument('--delay', type=float, default=0.05, help='upstream latency in seconds')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 100, 500])
+    parser.add_argument('--path', default='/api/products?category=Electronics&page=1')
+    args = parser.parse_args()
+
+    stub, stub_url = start_stub(args.delay)
+    try:
+        for label, runner in [('flask', run_flask), ('asgi', run_asgi)]:
+            port = free_port()
+            env = upstream_env(stub_url)
+            env.update({
+                # Only the Flask engine caches and coalesces; with either on
+                # it would be measuring cache hits, not the engine
+                'GATEWAY_CACHE_ENABLED': 'false',
+                'GATEWAY_COALESCE_ENABLED': 'false',
+                # One load generator address would hit the per-client limits
+                'GATEWAY_RATE_LIMIT_ENABLED': 'false'
+            })
+            gateway = runner(port, env)
+            try:
+                url = f"http://127.0.0.1:{port}{args.path}"
+                load(url, 200, 10)  # warm up pools
+                for concurrency in args.concurrency:
+                    result = load(url, args.requests, concurrency)
+                    print_row(f"{label} c={concurrency}", result)
+            finally:
+                gateway.terminate()
+                gateway.wait()
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import argparse
+import time
+
+from flask import Flask, jsonify
+from werkzeug.test import EnvironBuilder
+
+from metrics import init_metrics
+
+# Per-request cost of the metrics hooks: the same small Flask app with and
+# without init_metrics, called straight through WSGI so that nothing but
+# the request handling itself is timed.
+#
+#   python bench_metrics.py --requests 50000
+
+
+def make_app(instrumented):
+    app = Flask(__name__)
+    if instrumented:
+        init_metrics(app)
+
+    @app.route('/api/products/<product_id>')
+    def get_product(product_id):
+        return jsonify({'id': product_id, 'name': 'Widget', 'price': 9.99})
+
+    return app
+
+
+def run(app, environ, total):
+    def start_response(status, headers, exc_info=None):
+        pass
+
+    start = time.perf_counter()
+    for _ in range(total):
+        body = app.wsgi_app(dict(environ), start_response)
+        for _ in body:
+            pass
+        if hasattr(body, 'close'):
+            body.close()
+    return (time.perf_counter() - start) / total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the per-request overhead of /metrics instrumentation')
+    parser.add_argument('--requests', type=int, default=50000)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    environ = EnvironBuilder(path='/api/products/42').get_environ()
+    apps = {'plain': make_app(False), 'instrumented': make_app(True)}
+    best = {}
+    # Alternate the two apps and keep the best round of each, to keep
+    # noise from the machine out of the difference
+    for _ in range(args.rounds):
+        for label, app in apps.items():
+            per_request = run(app, environ, args.requests)
+            best[label] = min(best.get(label, per_request), per_request)
+
+    for label, per_request in best.items():
+        print(f"{label:<14} {per_request * 1e6:>8.1f} us/request  {1 / per_request:>10.0f} req/s")
+    overhead = best['instrumented'] - best['plain']
+    print(f"{'overhead':<14} {overhead * 1e6:>8.1f} us/request  ({overhead / best['plain'] * 100:.1f}%)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import argparse
+import json
+import sys
+import urllib.request
+
+from bench_common import free_port, load, print_row, start_process, start_stub, upstream_env
+
+# Tail latency and error rate with and without retries and hedging.
+#
+# Tail: product instances that answer in 5 ms, except for a few requests
+# that take 250 ms. Outage: one of two instances answers 503.
+#
+#   python bench_retries.py --slow-ratio 0.03 --concurrency 16
+
+MODES = [
+    ('single attempt', {'GATEWAY_RETRY_ENABLED': 'false'}),
+    ('retries', {'GATEWAY_RETRY_ENABLED': 'true', 'GATEWAY_HEDGE_ENABLED': 'false'}),
+    ('retries + hedging', {'GATEWAY_RETRY_ENABLED': 'true', 'GATEWAY_HEDGE_ENABLED': 'true'})
+]
+
+
+def run_gateway(port, env):
+    code = f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)"
+    return start_process([sys.executable, '-c', code], port, env)
+
+
+def run_scenario(label, instances, args):
+    print(label)
+    for mode, mode_env in MODES:
+        env = upstream_env(instances)
+        env.update({
+            # Every request has to reach an upstream
+            'GATEWAY_CACHE_ENABLED': 'false',
+            'GATEWAY_COALESCE_ENABLED': 'false',
+            'GATEWAY_RATE_LIMIT_ENABLED': 'false',
+            'UPSTREAM_MAX_IN_FLIGHT': '0',
+            'BREAKER_SLOW_CALL_SECONDS': '0',
+            # Keep the balancer from routing around the 503s on its own
+            'UPSTREAM_LB_STRATEGY': 'round_robin',
+            'UPSTREAM_EJECT_AFTER_FAILURES': '0',
+            'BREAKER_MIN_CALLS': str(args.requests * 10)
+        })
+        env.update(mode_env)
+        port = free_port()
+        gateway = run_gateway(port, env)
+        try:
+            url = f"http://127.0.0.1:{port}/api/products?page=1"
+            load(url, 200, args.concurrency)
+            print_row(f"  {mode}", load(url, args.requests, args.concurrency))
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/gateway/stats") as response:
+                retries = json.load(response)['retries']
+            if retries:
+                print(f"  {'':<26} retries {retries['retries']}  denied {retries['retries_denied']}  "
+                      f"hedges {retries['hedges']}  won {retries['hedges_won']}")
+        finally:
+            gateway.terminate()
+            gateway.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure gateway retries and hedging')
+    parser.add_argument('--slow-ratio', type=float, default=0.03)
+    parser.add_argument('--slow-delay', type=float, default=0.25)
+    parser.add_argument('--requests', type=int, default=3000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+
+    stubs = [start_stub(0.005, slow_ratio=args.slow_ratio, slow_delay=args.slow_delay) for _ in range(2)]
+    try:
+        run_scenario('slow tail', ','.join(url for _, url in stubs), args)
+    finally:
+        for stub, _ in stubs:
+            stub.terminate()
+            stub.wait()
+
+    stubs = [start_stub(0.005), start_stub(0.005, status=503)]
+    try:
+        run_scenario('one instance answering 503', ','.join(url for _, url in stubs), args)
+    finally:
+        for stub, _ in stubs:
+            stub.terminate()
+            stub.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import argparse
+import random
+import timeit
+
+from routing import DEFAULT_ROUTES, RouteTable, SERVICE_URLS
+
+# Lookup cost of the compiled route trie as the table grows, next to the
+# old startswith chain plus PUBLIC_ROUTES scan:
+#
+#   python bench_routing.py --routes 10 100 1000 10000
+
+
+def make_routes(count):
+    upstreams = list(SERVICE_URLS)
+    routes = list(DEFAULT_ROUTES)
+    for i in range(count - len(routes)):
+        routes.append({
+            'prefix': f"/api/svc{i}/v{i % 3}",
+            'upstream': upstreams[i % len(upstreams)],
+            'public': ['GET'] if i % 4 == 0 else []
+        })
+    return routes
+
+
+def linear_lookup(routes, public, path, method):
+    # Equivalent of the original if/elif chain followed by the public scan
+    upstream = None
+    for route in routes:
+        if path.startswith(route['prefix']) and 'upstream' in route:
+            upstream = route['upstream']
+            break
+    requires_auth = True
+    for prefix in public:
+        if path.startswith(prefix) and method == 'GET':
+            requires_auth = False
+            break
+    return upstream, requires_auth
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark gateway route lookups')
+    parser.add_argument('--routes', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--lookups', type=int, default=100000)
+    args = parser.parse_args()
+
+    print(f"{'routes':>8} {'trie ns/lookup':>16} {'linear ns/lookup':>18}")
+    for count in args.routes:
+        routes = make_routes(count)
+        table = RouteTable(routes)
+        # Longest prefixes first so the linear scan finds the same upstream
+        ordered = sorted(routes, key=lambda route: len(route['prefix']), reverse=True)
+        public = [route['prefix'] for route in routes if route.get('public')]
+        paths = [random.choice(routes)['prefix'] + '/123?x=1' for _ in range(1000)]
+        paths.append('/api/orders/42')
+
+        trie = timeit.timeit(
+            lambda: [table.lookup(path) for path in paths],
+            number=max(args.lookups // len(paths), 1)
+        )
+        linear = timeit.timeit(
+            lambda: [linear_lookup(ordered, public, path, 'GET') for path in paths],
+            number=max(args.lookups // len(paths) // max(count // 100, 1), 1)
+        ) * max(count // 100, 1)
+
+        total = max(args.lookups // len(paths), 1) * len(paths)
+        print(f"{count:>8} {trie / total * 1e9:>16.0f} {linear / total * 1e9:>18.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+import threading
+import time
+from collections import deque
+
+import requests
+
+
+class UpstreamRejected(requests.exceptions.RequestException):
+    """The gateway refused to call an upstream without trying it."""
+
+
+class CircuitOpenError(UpstreamRejected):
+    pass
+
+
+class BulkheadFullError(UpstreamRejected):
+    pass
+
+
+class CircuitBreaker:
+    """Count-based circuit breaker with failure-rate and slow-call thresholds.
+
+    Closed: calls flow and their outcomes fill a sliding window. Once the
+    window holds min_calls outcomes and the failure or slow-call rate crosses
+    its threshold, the breaker opens and rejects calls for open_seconds. It
+    then lets half_open_calls probes through; if all of them succeed it closes
+    again, otherwise it reopens.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, window=50, min_calls=20, failure_rate=0.5, slow_call_seconds=5.0,
+                 slow_call_rate=0.5, open_seconds=30.0, half_open_calls=3):
+        self.min_calls = min_calls
+        self.failure_rate_threshold = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.state = self.CLOSED
+        self.times_opened = 0
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self.times_opened += 1
+        self._outcomes.clear()
+
+    def _rates(self):
+        calls = len(self._outcomes)
+        if not calls:
+            return 0.0, 0.0
+        failures = sum(1 for failed, _ in self._outcomes if failed)
+        slow = sum(1 for _, is_slow in self._outcomes if is_slow)
+        return failures / calls, slow / calls
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probes = 0
+                self._probe_successes = 0
+            if self.state == self.HALF_OPEN:
+                if self._probes >= self.half_open_calls:
+                    return False
+                self._probes += 1
+            return True
+
+    def record(self, success, duration):
+        slow = bool(self.slow_call_seconds) and duration >= self.slow_call_seconds
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                if not success or slow:
+                    self._open()
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.half_open_calls:
+                        self.state = self.CLOSED
+                return
+            if self.state == self.OPEN:
+                # Finished after the breaker tripped; nothing left to decide
+                return
+
+            self._outcomes.append((not success, slow))
+            if len(self._outcomes) >= self.min_calls:
+                failure_rate, slow_rate = self._rates()
+                if failure_rate >= self.failure_rate_threshold or slow_rate >= self.slow_call_rate_threshold:
+                    self._open()
+
+    def stats(self):
+        with self._lock:
+            failure_rate, slow_rate = self._rates()
+            return {
+                'state': self.state,
+                'calls_in_window': len(self._outcomes),
+                'failure_rate': round(failure_rate, 3),
+                'slow_call_rate': round(slow_rate, 3),
+                'times_opened': self.times_opened
+            }
+
+
+class Bulkhead:
+    """Cap on concurrent calls; excess calls are rejected, not queued."""
+
+    def __init__(self, max_in_flight):
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self.max_in_flight and self.in_flight >= self.max_in_flight:
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
@@ -0,0 +1,188 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode
+
+from flask import Response
+
+# Edge cache for anonymous GETs on public routes (see "cache" in routing.py)
+CACHE_ENABLED = os.environ.get('GATEWAY_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes', 'on')
+CACHE_MAX_BYTES = int(os.environ.get('GATEWAY_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+CACHE_MAX_ENTRIES = int(os.environ.get('GATEWAY_CACHE_MAX_ENTRIES', 10000))
+
+# Rough per-entry bookkeeping cost so tiny bodies still count toward the limit
+ENTRY_OVERHEAD = 512
+
+# Media types upstreams pick on Accept (the product service's msgpack); each
+# is cached apart, and any other Accept shares the default (JSON) entry
+CACHE_ACCEPT_VARIANTS = [
+    name.strip().lower()
+    for name in os.environ.get('GATEWAY_CACHE_ACCEPT_VARIANTS', 'application/msgpack,application/x-msgpack').split(',')
+    if name.strip()
+]
+
+
+def accept_variant(accept):
+    """The entry of CACHE_ACCEPT_VARIANTS that accept asks for, or ''."""
+    if accept:
+        accept = accept.lower()
+        for variant in CACHE_ACCEPT_VARIANTS:
+            if variant in accept:
+                return variant
+    return ''
+
+
+def cache_key(path, query_string, variant=''):
+    """Path plus the query with parameters in a canonical order, and the
+    accept_variant() of the request if any."""
+    if isinstance(query_string, bytes):
+        query_string = query_string.decode('latin-1')
+    params = sorted(parse_qsl(query_string, keep_blank_values=True))
+    key = f"{path}?{urlencode(params)}" if params else path
+    return f"{key} {variant}" if variant else key
+
+
+def make_etag(body):
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+class CachedResponse:
+    __slots__ = ('status', 'headers', 'body', 'etag', 'stored_at', 'ttl', 'stale_ttl', 'encoded')
+
+    def __init__(self, status, headers, body, etag, ttl, stale_ttl):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.etag = etag
+        self.stored_at = time.time()
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        # Compressed copies of body by Content-Encoding, filled on first use
+        # through ResponseCache.add_encoded, which counts their bytes
+        self.encoded = {}
+
+    @property
+    def size(self):
+        return len(self.body) + sum(len(body) for body in self.encoded.values()) + ENTRY_OVERHEAD
+
+    def age(self, now):
+        return now - self.stored_at
+
+    def is_fresh(self, now):
+        return self.age(now) < self.ttl
+
+    def is_usable(self, now):
+        return self.age(now) < self.ttl + self.stale_ttl
+
+
+class ResponseCache:
+    """Size-bounded LRU of upstream responses with per-entry TTLs."""
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, max_entries=CACHE_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self.counters = {
+            'hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'not_modified': 0,
+            'evictions': 0,
+            'refreshes': 0
+        }
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._entries[key] = entry
+            self._bytes += entry.size
+            self._evict()
+
+    def add_encoded(self, key, entry, encoding, body):
+        """Keep a compressed copy of a cached entry's body, counted in the
+        cache's size. Dropped if entry is no longer the one cached at key."""
+        with self._lock:
+            if self._entries.get(key) is not entry or encoding in entry.encoded:
+                return
+            entry.encoded[encoding] = body
+            self._bytes += len(body)
+            self._evict()
+
+    def _evict(self):
+        while self._bytes > self.max_bytes or len(self._entries) > self.max_entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self.counters['evictions'] += 1
+
+    def begin_refresh(self, key):
+        """Claim the background refresh for key; False if one is running."""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            self.counters['refreshes'] += 1
+            return True
+
+    def end_refresh(self, key):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, entries=len(self._entries), bytes=self._bytes,
+                        max_bytes=self.max_bytes, max_entries=self.max_entries)
+
+
+def build_response(entry, if_none_match, state, now=None):
+    """Serve a cached entry, as a 304 when the client already has it."""
+    now = time.time() if now is None else now
+    validators = [
+        ('ETag', entry.etag),
+        ('Cache-Control', f"public, max-age={int(entry.ttl)}, stale-while-revalidate={int(entry.stale_ttl)}"),
+        ('Age', str(int(entry.age(now)))),
+        ('X-Cache', state)
+    ]
+    if etag_matches(if_none_match, entry.etag):
+        return Response(status=304, headers=validators)
+    return Response(entry.body, status=entry.status, headers=list(entry.headers) + validators)
@@ -0,0 +1,74 @@
+import os
+import threading
+
+from cache import cache_key
+
+# Collapse identical in-flight GETs into a single upstream request
+COALESCE_ENABLED = os.environ.get('GATEWAY_COALESCE_ENABLED', 'true').lower() in ('1', 'true', 'yes', 'on')
+
+# Request headers that can change an upstream response, and so are part of
+# the identity of a request
+VARY_HEADERS = [
+    name.strip().lower()
+    for name in os.environ.get(
+        'GATEWAY_COALESCE_VARY_HEADERS',
+        'Authorization,Cookie,Accept,Accept-Encoding,Accept-Language'
+    ).split(',')
+    if name.strip()
+]
+
+
+def coalesce_key(method, target, headers, vary=VARY_HEADERS):
+    path, _, query = target.partition('?')
+    lowered = {key.lower(): value for key, value in headers.items()}
+    return (method, cache_key(path, query)) + tuple(lowered.get(name, '') for name in vary)
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run at most one call per key at a time and share its outcome."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.counters = {'leaders': 0, 'coalesced': 0}
+
+    def do(self, key, fn):
+        """Return (result, shared); shared is True when another caller ran fn."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.counters['leaders'] += 1
+            else:
+                self.counters['coalesced'] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result, False
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, in_flight=len(self._calls))
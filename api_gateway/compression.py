@@ -0,0 +1,150 @@
+import json
+import os
+import zlib
+
+from werkzeug.wsgi import ClosingIterator
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# Response compression negotiated from Accept-Encoding
+COMPRESSION_ENABLED = os.environ.get('GATEWAY_COMPRESSION_ENABLED', 'true').lower() in ('1', 'true', 'yes', 'on')
+COMPRESSION_MIN_SIZE = int(os.environ.get('GATEWAY_COMPRESSION_MIN_SIZE', 1024))
+
+# Levels per content type (matched by prefix, longest first). Structured
+# JSON compresses well even at moderate levels; override with
+# GATEWAY_COMPRESSION_LEVELS='{"application/json": {"gzip": 5, "br": 4}}'.
+DEFAULT_LEVELS = {
+    'application/json': {'gzip': 6, 'br': 5},
+    'application/javascript': {'gzip': 6, 'br': 5},
+    'application/xml': {'gzip': 6, 'br': 5},
+    'image/svg+xml': {'gzip': 6, 'br': 5},
+    'text/': {'gzip': 6, 'br': 5},
+    'text/csv': {'gzip': 4, 'br': 3}
+}
+COMPRESSION_LEVELS = dict(DEFAULT_LEVELS, **json.loads(os.environ.get('GATEWAY_COMPRESSION_LEVELS', '{}')))
+
+# Preferred first when the client weighs encodings equally
+ENCODINGS = ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def negotiate(accept_encoding, available=ENCODINGS):
+    """Pick the encoding to use for an Accept-Encoding header, or None."""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            weights[name] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in available:
+        quality = weights.get(encoding, weights.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def levels_for(content_type):
+    mimetype = content_type.split(';', 1)[0].strip().lower()
+    for prefix in sorted(COMPRESSION_LEVELS, key=len, reverse=True):
+        if mimetype.startswith(prefix):
+            return COMPRESSION_LEVELS[prefix]
+    return None
+
+
+def _compressor(encoding, level):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=level)
+        return compressor.process, compressor.flush, compressor.finish
+    # wbits=31 writes a gzip header and trailer
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+
+def compress(data, encoding, level):
+    process, _, finish = _compressor(encoding, level)
+    return process(data) + finish()
+
+
+def compress_stream(chunks, encoding, level):
+    """Compress an iterable of chunks, flushing after each one so the client
+    sees data as soon as the upstream sends it. Closing the result closes
+    chunks."""
+    body = _compress_chunks(chunks, encoding, level)
+    close = getattr(chunks, 'close', None)
+    return ClosingIterator(body, close) if close is not None else body
+
+
+def _compress_chunks(chunks, encoding, level):
+    process, flush, finish = _compressor(encoding, level)
+    for chunk in chunks:
+        if chunk:
+            data = process(chunk) + flush()
+            if data:
+                yield data
+    yield finish()
+
+
+def compress_response(response, accept_encoding, min_size=COMPRESSION_MIN_SIZE, encoded=None, store=None):
+    """Compress a Flask response in place when the client and content allow.
+
+    encoded, if given, is a dict of already compressed bodies by encoding
+    (see CachedResponse.encoded); it is used instead of compressing the same
+    cached body on every hit. A newly compressed body is passed to
+    store(encoding, body), or else added to encoded.
+    """
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return response
+    if 'Content-Encoding' in response.headers:
+        return response
+    if 'no-transform' in response.headers.get('Cache-Control', ''):
+        return response
+    levels = levels_for(response.headers.get('Content-Type', ''))
+    if levels is None:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate(accept_encoding)
+    if encoding is None:
+        return response
+
+    if response.is_streamed or response.direct_passthrough:
+        length = response.headers.get('Content-Length')
+        if length is not None and int(length) < min_size:
+            return response
+        response.response = compress_stream(response.response, encoding, levels[encoding])
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        if encoded is None:
+            body = compress(data, encoding, levels[encoding])
+        else:
+            body = encoded.get(encoding)
+            if body is None:
+                body = compress(data, encoding, levels[encoding])
+                if store is not None:
+                    store(encoding, body)
+                else:
+                    encoded[encoding] = body
+        response.set_data(body)
+
+    response.headers['Content-Encoding'] = encoding
+    # A strong ETag names exact bytes, which are now different
+    etag = response.headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        response.headers['ETag'] = 'W/' + etag
+    return response
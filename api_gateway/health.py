@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from balancer import service_status
+from coalesce import SingleFlight
+
+# Deep health checks: all upstreams are probed in parallel and the result is
+# reused for HEALTH_CACHE_TTL seconds. Older results are still served while a
+# background round refreshes them, up to HEALTH_MAX_STALE seconds.
+HEALTH_TIMEOUT = float(os.environ.get('GATEWAY_HEALTH_TIMEOUT', 2))
+HEALTH_CACHE_TTL = float(os.environ.get('GATEWAY_HEALTH_CACHE_TTL', 5))
+HEALTH_MAX_STALE = float(os.environ.get('GATEWAY_HEALTH_MAX_STALE', 30))
+
+
+class HealthChecker:
+    def __init__(self, upstreams, ttl=HEALTH_CACHE_TTL, max_stale=HEALTH_MAX_STALE, timeout=HEALTH_TIMEOUT):
+        self.upstreams = upstreams
+        self.ttl = ttl
+        self.max_stale = max(max_stale, ttl)
+        self.timeout = timeout
+        self.rounds = 0
+        # One probe per instance of every upstream
+        self.targets = [
+            (name, instance)
+            for name, upstream in upstreams.items()
+            for instance in upstream.balancer.instances
+        ]
+        self._executor = ThreadPoolExecutor(max_workers=max(len(self.targets), 1), thread_name_prefix='health')
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._result = None
+        self._checked_at = 0.0
+
+    def probe(self, target):
+        # Probes bypass the circuit breaker so they still report on open
+        # circuits; instances that fail them stop receiving traffic
+        name, instance = target
+        upstream = self.upstreams[name]
+        start = time.perf_counter()
+        try:
+            response = upstream.request('GET', '/health', guard=False, instance=instance, timeout=self.timeout)
+            status = 'healthy' if response.status_code == 200 else 'unhealthy'
+        except Exception:
+            status = 'unavailable'
+        upstream.balancer.mark_health(instance, status == 'healthy')
+        return name, status, (time.perf_counter() - start) * 1000
+
+    def check(self):
+        """Probe every upstream concurrently and store the result."""
+        statuses = {name: [] for name in self.upstreams}
+        latencies = {name: 0.0 for name in self.upstreams}
+        for name, status, latency in self._executor.map(self.probe, self.targets):
+            statuses[name].append(status)
+            latencies[name] = max(latencies[name], latency)
+
+        health_status = {
+            'status': 'healthy',
+            'services': {name: service_status(results) for name, results in statuses.items()},
+            'latency_ms': {name: round(latency, 1) for name, latency in latencies.items()}
+        }
+        if any(status != 'healthy' for results in statuses.values() for status in results):
+            health_status['status'] = 'degraded'
+
+        with self._lock:
+            self._result = health_status
+            self._checked_at = time.monotonic()
+            self.rounds += 1
+        return health_status
+
+    def _refresh(self):
+        # Concurrent callers share one probe round
+        result, _ = self._flight.do('health', self.check)
+        return result
+
+    def _background_refresh(self):
+        try:
+            self._refresh()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def status(self):
+        """Latest health report, with its age in seconds."""
+        with self._lock:
+            result = self._result
+            age = time.monotonic() - self._checked_at
+            refresh = result is not None and age >= self.ttl and not self._refreshing
+            if refresh:
+                self._refreshing = True
+
+        if result is None or age >= self.max_stale:
+            result, age = self._refresh(), 0.0
+        elif refresh:
+            threading.Thread(target=self._background_refresh, daemon=True).start()
+
+        return dict(result, age_seconds=round(age, 3))
@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+
+from flask import Response, request
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Prometheus metrics for a Flask service: request counts, latency and
+# in-flight requests per route template, and the latency of calls made to
+# other services. Served on /metrics.
+#
+# Every service keeps an identical copy of this file, since each one is
+# built from its own directory.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes', 'on')
+METRICS_PATH = os.environ.get('METRICS_PATH', '/metrics')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+
+REQUESTS = Counter(
+    'http_requests_total', 'HTTP requests handled',
+    ['route', 'method', 'status']
+)
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time to produce a response, by route template',
+    ['route', 'method'], buckets=LATENCY_BUCKETS
+)
+IN_FLIGHT = Gauge('http_requests_in_flight', 'HTTP requests being handled')
+UPSTREAM_LATENCY = Histogram(
+    'upstream_request_duration_seconds', 'Latency of calls to other services',
+    ['upstream', 'method', 'outcome'], buckets=LATENCY_BUCKETS
+)
+# Gateway protections per upstream, for alerting on open circuits and full
+# bulkheads; read from the gateway's upstream clients at scrape time
+UPSTREAM_CIRCUIT_STATE = Gauge(
+    'upstream_circuit_state', 'Circuit breaker state: 0 closed, 1 half open, 2 open',
+    ['upstream']
+)
+UPSTREAM_IN_FLIGHT = Gauge('upstream_requests_in_flight', 'Calls to an upstream holding a bulkhead slot', ['upstream'])
+UPSTREAM_REJECTIONS = Counter(
+    'upstream_rejections_total', 'Calls refused without trying the upstream (circuit_open, bulkhead_full)',
+    ['upstream', 'reason']
+)
+
+# labels() validates and locks on every call; the children are looked up
+# once per label set and kept here instead
+_children = {}
+_children_lock = threading.Lock()
+
+
+def _child(metric, labels):
+    key = (metric, labels)
+    child = _children.get(key)
+    if child is None:
+        with _children_lock:
+            child = _children.setdefault(key, metric.labels(*labels))
+    return child
+
+
+def outcome(status_code):
+    return f"{status_code // 100}xx"
+
+
+def observe_upstream(upstream, method, result, seconds):
+    """Record one call to another service; result is outcome(status) or 'error'."""
+    if METRICS_ENABLED:
+        _child(UPSTREAM_LATENCY, (upstream, method, result)).observe(seconds)
+
+
+def count_rejection(upstream, reason):
+    """Record a call refused before reaching upstream."""
+    if METRICS_ENABLED:
+        _child(UPSTREAM_REJECTIONS, (upstream, reason)).inc()
+
+
+def watch_upstream(upstream, circuit_state, in_flight):
+    """Report circuit_state() and in_flight() of upstream on every scrape."""
+    if METRICS_ENABLED:
+        _child(UPSTREAM_CIRCUIT_STATE, (upstream,)).set_function(circuit_state)
+        _child(UPSTREAM_IN_FLIGHT, (upstream,)).set_function(in_flight)
+
+
+def timed_request(upstream, method, url, **kwargs):
+    """requests.request() that records its latency under upstream."""
+    # Imported here since not every service depends on requests
+    import requests
+
+    start = time.perf_counter()
+    try:
+        response = requests.request(method, url, **kwargs)
+    except requests.exceptions.RequestException:
+        observe_upstream(upstream, method, 'error', time.perf_counter() - start)
+        raise
+    observe_upstream(upstream, method, outcome(response.status_code), time.perf_counter() - start)
+    return response
+
+
+def label_route(route):
+    """Label the current request with route instead of its URL rule (the
+    gateway uses its route prefixes instead of its catch-all rule)."""
+    request.environ['metrics.route'] = route
+
+
+def _record_rule():
+    # The matched rule is gone by the time the middleware sees the response
+    rule = request.url_rule
+    if rule is not None:
+        request.environ.setdefault('metrics.route', rule.rule)
+
+
+class _MetricsMiddleware:
+    # Timing around the WSGI app is cheaper than after_request and
+    # teardown hooks, which cost more per request than the metrics do
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        status = ['500']
+
+        def recording_start_response(status_line, headers, exc_info=None):
+            status[0] = status_line[:3]
+            return start_response(status_line, headers, exc_info)
+
+        IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            return self.wsgi_app(environ, recording_start_response)
+        finally:
+            elapsed = time.perf_counter() - start
+            IN_FLIGHT.dec()
+            route = environ.get('metrics.route', 'unmatched')
+            method = environ.get('REQUEST_METHOD', 'GET')
+            _child(REQUESTS, (route, method, status[0])).inc()
+            _child(REQUEST_LATENCY, (route, method)).observe(elapsed)
+
+
+def _metrics_view():
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_metrics(app):
+    """Instrument every request of app and serve the metrics on METRICS_PATH.
+    Latency is measured until the response headers are ready."""
+    if not METRICS_ENABLED:
+        return
+    app.wsgi_app = _MetricsMiddleware(app.wsgi_app)
+    app.before_request(_record_rule)
+    app.add_url_rule(METRICS_PATH, 'metrics', _metrics_view, methods=['GET'])
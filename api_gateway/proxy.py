@@ -0,0 +1,90 @@
+import os
+
+from flask import Response
+from werkzeug.wsgi import ClosingIterator
+
+# Size of the chunks copied between upstream and client in streaming mode
+STREAM_CHUNK_SIZE = int(os.environ.get('GATEWAY_STREAM_CHUNK_SIZE', 64 * 1024))
+
+# Headers that only apply to a single connection and must not be forwarded
+HOP_BY_HOP_HEADERS = frozenset([
+    'connection',
+    'keep-alive',
+    'proxy-authenticate',
+    'proxy-authorization',
+    'te',
+    'trailer',
+    'trailers',
+    'transfer-encoding',
+    'upgrade'
+])
+
+
+def filter_headers(headers, drop=()):
+    """Return (name, value) pairs without hop-by-hop headers or names in drop."""
+    headers = list(headers)
+    connection_tokens = set()
+    for key, value in headers:
+        if key.lower() == 'connection':
+            connection_tokens.update(token.strip().lower() for token in value.split(','))
+
+    excluded = HOP_BY_HOP_HEADERS | connection_tokens | {name.lower() for name in drop}
+    return [(key, value) for key, value in headers if key.lower() not in excluded]
+
+
+class _RequestBody:
+    # Wraps the WSGI input so requests sends it with a Content-Length
+    # instead of buffering it or switching to chunked encoding
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        return self.stream.read(size)
+
+
+def _iter_stream(stream):
+    while True:
+        chunk = stream.read(STREAM_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+def request_body(flask_request):
+    """Raw request body for the upstream call, never parsed by the gateway."""
+    length = flask_request.content_length
+    if length:
+        return _RequestBody(flask_request.stream, length)
+    if flask_request.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+        return _iter_stream(flask_request.stream)
+    return None
+
+
+def upstream_path(flask_request, full_path):
+    """Path plus the untouched query string of the incoming request."""
+    query = flask_request.query_string.decode('latin-1')
+    return f"{full_path}?{query}" if query else full_path
+
+
+def stream_response(upstream_response):
+    """Build a Flask response that relays the upstream body chunk by chunk."""
+    headers = filter_headers(upstream_response.raw.headers.iteritems())
+    # Content-Encoding and Content-Length stay valid because the bytes
+    # are passed through without being decoded
+    # The WSGI server closes a direct_passthrough body itself, without
+    # the response's close callbacks, so the upstream response (and the
+    # bulkhead slot it holds) is closed along with the body
+    body = ClosingIterator(upstream_response.raw.stream(STREAM_CHUNK_SIZE, decode_content=False),
+                           upstream_response.close)
+
+    response = Response(
+        body,
+        status=upstream_response.status_code,
+        headers=headers,
+        direct_passthrough=True
+    )
+    return response
@@ -0,0 +1,220 @@
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Token-bucket rate limiting per client. Routes can set their own bucket
+# ("rate_limit" in routing.py); GATEWAY_RATE_LIMIT_RATE/BURST add an overall
+# per-client bucket on top (0 turns it off).
+RATE_LIMIT_ENABLED = os.environ.get('GATEWAY_RATE_LIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes', 'on')
+RATE_LIMIT_BACKEND = os.environ.get('GATEWAY_RATE_LIMIT_BACKEND', 'memory')
+RATE_LIMIT_RATE = float(os.environ.get('GATEWAY_RATE_LIMIT_RATE', 0))
+RATE_LIMIT_BURST = float(os.environ.get('GATEWAY_RATE_LIMIT_BURST', 0))
+# How clients are told apart: 'ip', or 'token' for the Authorization header
+RATE_LIMIT_CLIENT_KEY = os.environ.get('GATEWAY_RATE_LIMIT_CLIENT_KEY', 'ip')
+TRUST_FORWARDED_FOR = os.environ.get('GATEWAY_TRUST_FORWARDED_FOR', 'false').lower() in ('1', 'true', 'yes', 'on')
+MEMORY_MAX_BUCKETS = int(os.environ.get('GATEWAY_RATE_LIMIT_MAX_BUCKETS', 100000))
+
+
+class Decision:
+    __slots__ = ('allowed', 'limit', 'remaining', 'reset', 'retry_after')
+
+    def __init__(self, allowed, limit, remaining, reset, retry_after):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        self.reset = reset
+        self.retry_after = retry_after
+
+    def headers(self):
+        headers = {
+            'RateLimit-Limit': str(int(self.limit)),
+            'RateLimit-Remaining': str(int(self.remaining)),
+            'RateLimit-Reset': str(int(math.ceil(self.reset)))
+        }
+        if not self.allowed:
+            headers['Retry-After'] = str(max(int(math.ceil(self.retry_after)), 1))
+        return headers
+
+
+def _decision(allowed, tokens, rate, burst, cost):
+    # Seconds until the bucket is full again, and until cost tokens are there
+    reset = (burst - tokens) / rate
+    retry_after = 0.0 if allowed else (cost - tokens) / rate
+    return Decision(allowed, burst, math.floor(tokens), reset, retry_after)
+
+
+class MemoryBackend:
+    """Buckets held in this process; fine for a single gateway replica."""
+
+    def __init__(self, max_buckets=MEMORY_MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, buckets, cost=1):
+        """Take cost from every (key, rate, burst) bucket, or from none of
+        them if any is short; one Decision per bucket."""
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            for key, rate, burst in buckets:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    tokens = burst
+                    if len(self._buckets) >= self.max_buckets:
+                        # Idle buckets drift to the front; a full bucket is the
+                        # same as no bucket, so evicting them is safe enough
+                        self._buckets.popitem(last=False)
+                else:
+                    tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                    self._buckets.move_to_end(key)
+                levels.append(tokens)
+            allowed = all(tokens >= cost for tokens in levels)
+            if allowed:
+                levels = [tokens - cost for tokens in levels]
+            for (key, _, _), tokens in zip(buckets, levels):
+                self._buckets[key] = (tokens, now)
+        return [_decision(allowed or tokens >= cost, tokens, rate, burst, cost)
+                for (_, rate, burst), tokens in zip(buckets, levels)]
+
+
+# Refill every bucket (KEYS, with rate and burst pairs in ARGV after the
+# cost) and take from all or none of them in one atomic step, using the
+# Redis clock so every gateway replica agrees on time
+TOKEN_BUCKET_SCRIPT = """
+local cost = tonumber(ARGV[1])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local levels = {}
+local allowed = 1
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2])
+    local burst = tonumber(ARGV[i * 2 + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1])
+    local ts = tonumber(state[2])
+    if tokens == nil then
+        tokens = burst
+    else
+        tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    end
+    if tokens < cost then
+        allowed = 0
+    end
+    levels[i] = tokens
+end
+
+local result = {allowed}
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2])
+    local burst = tonumber(ARGV[i * 2 + 1])
+    local tokens = levels[i]
+    if allowed == 1 then
+        tokens = tokens - cost
+    end
+    redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('PEXPIRE', key, math.ceil(burst / rate * 1000) + 1000)
+    result[i + 1] = tostring(tokens)
+end
+return result
+"""
+
+
+class RedisBackend:
+    """Buckets shared by all gateway replicas through Redis."""
+
+    def __init__(self, client=None, prefix='ratelimit:'):
+        if client is None:
+            import redis
+            client = redis.Redis(
+                host=os.environ.get('REDIS_HOST', 'localhost'),
+                port=int(os.environ.get('REDIS_PORT', 6379)),
+                db=int(os.environ.get('GATEWAY_RATE_LIMIT_REDIS_DB', 0)),
+                socket_timeout=0.1,
+                socket_connect_timeout=0.1
+            )
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def take(self, buckets, cost=1):
+        """Same as MemoryBackend.take, in one script call."""
+        args = [cost]
+        for _, rate, burst in buckets:
+            args += [rate, burst]
+        result = self._script(keys=[self.prefix + key for key, _, _ in buckets], args=args)
+        allowed = bool(result[0])
+        levels = [float(tokens) for tokens in result[1:]]
+        return [_decision(allowed or tokens >= cost, tokens, rate, burst, cost)
+                for (_, rate, burst), tokens in zip(buckets, levels)]
+
+
+def client_id(flask_request):
+    if RATE_LIMIT_CLIENT_KEY == 'token' and flask_request.headers.get('Authorization'):
+        token = flask_request.headers['Authorization'].encode('utf-8')
+        return 'token:' + hashlib.blake2b(token, digest_size=12).hexdigest()
+    if TRUST_FORWARDED_FOR and flask_request.headers.get('X-Forwarded-For'):
+        return 'ip:' + flask_request.headers['X-Forwarded-For'].split(',')[0].strip()
+    return 'ip:' + (flask_request.remote_addr or 'unknown')
+
+
+class RateLimiter:
+    def __init__(self, backend, rate=RATE_LIMIT_RATE, burst=RATE_LIMIT_BURST):
+        self.backend = backend
+        self.rate = rate
+        self.burst = burst or rate
+        self._lock = threading.Lock()
+        self.counters = {'allowed': 0, 'rejected': 0, 'errors': 0}
+        self.rejected_by_route = {}
+
+    def check(self, client, route):
+        """Take a token from every bucket that applies, or from none of them
+        if one is empty (a request rejected by the route's bucket doesn't
+        use up the overall one); returns the most restrictive Decision, or
+        None when no limit applies."""
+        buckets = []
+        if self.rate > 0:
+            buckets.append((client, self.rate, self.burst))
+        if route.rate_limit:
+            rate, burst = route.rate_limit
+            buckets.append((f"{client}:{route.prefix}", rate, burst))
+        if not buckets:
+            return None
+        try:
+            decisions = self.backend.take(buckets)
+        except Exception as e:
+            # A broken limiter backend must not take the API down with it
+            print(f"Error checking rate limit: {str(e)}")
+            with self._lock:
+                self.counters['errors'] += 1
+            return None
+
+        rejected = [decision for decision in decisions if not decision.allowed]
+        if rejected:
+            decision = max(rejected, key=lambda d: d.retry_after)
+        else:
+            decision = min(decisions, key=lambda d: d.remaining)
+
+        with self._lock:
+            if decision.allowed:
+                self.counters['allowed'] += 1
+            else:
+                self.counters['rejected'] += 1
+                self.rejected_by_route[route.prefix] = self.rejected_by_route.get(route.prefix, 0) + 1
+        return decision
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, rejected_by_route=dict(self.rejected_by_route),
+                        backend=type(self.backend).__name__)
+
+
+def create_rate_limiter():
+    if not RATE_LIMIT_ENABLED:
+        return None
+    backend = RedisBackend() if RATE_LIMIT_BACKEND == 'redis' else MemoryBackend()
+    return RateLimiter(backend)
@@ -0,0 +1,262 @@
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+from breaker import UpstreamRejected
+
+# Retries for idempotent calls, limited by a budget shared by all upstreams
+RETRY_ENABLED = os.environ.get('GATEWAY_RETRY_ENABLED', 'true').lower() in ('1', 'true', 'yes', 'on')
+RETRY_ATTEMPTS = int(os.environ.get('GATEWAY_RETRY_ATTEMPTS', 3))
+RETRY_BACKOFF = float(os.environ.get('GATEWAY_RETRY_BACKOFF', 0.025))
+RETRY_BACKOFF_MAX = float(os.environ.get('GATEWAY_RETRY_BACKOFF_MAX', 0.25))
+# Retries (and hedges) may add at most this share of recent requests, plus
+# a small floor so a quiet gateway can still retry
+RETRY_BUDGET_RATIO = float(os.environ.get('GATEWAY_RETRY_BUDGET_RATIO', 0.1))
+RETRY_BUDGET_MIN_PER_SECOND = float(os.environ.get('GATEWAY_RETRY_BUDGET_MIN_PER_SECOND', 5))
+RETRY_BUDGET_WINDOW = int(os.environ.get('GATEWAY_RETRY_BUDGET_WINDOW', 10))
+
+# Hedging: if a GET hasn't answered after the upstream's recent p95, send
+# a second one to another instance and use whichever answers first
+HEDGE_ENABLED = os.environ.get('GATEWAY_HEDGE_ENABLED', 'false').lower() in ('1', 'true', 'yes', 'on')
+HEDGE_PERCENTILE = float(os.environ.get('GATEWAY_HEDGE_PERCENTILE', 95))
+HEDGE_MIN_DELAY = float(os.environ.get('GATEWAY_HEDGE_MIN_DELAY', 0.01))
+HEDGE_MIN_SAMPLES = int(os.environ.get('GATEWAY_HEDGE_MIN_SAMPLES', 50))
+HEDGE_WORKERS = int(os.environ.get('GATEWAY_HEDGE_WORKERS', 64))
+
+# Safe methods are retried after any failure. PUT and DELETE are only
+# retried when the connection was never made: after a timeout or a 5xx the
+# upstream may already have applied the write (and sent its notification).
+SAFE_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+CONNECT_RETRY_METHODS = frozenset(['PUT', 'DELETE'])
+HEDGE_METHODS = frozenset(['GET', 'HEAD'])
+RETRY_STATUSES = frozenset([502, 503, 504])
+
+
+class RetryBudget:
+    """Sliding window count of requests and retries, in one second buckets."""
+
+    def __init__(self, ratio=RETRY_BUDGET_RATIO, min_per_second=RETRY_BUDGET_MIN_PER_SECOND,
+                 window=RETRY_BUDGET_WINDOW):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = window
+        # [second, requests, retries] per slot
+        self._buckets = [[0, 0, 0] for _ in range(window)]
+        self._lock = threading.Lock()
+
+    def _bucket(self, second):
+        bucket = self._buckets[second % self.window]
+        if bucket[0] != second:
+            bucket[:] = [second, 0, 0]
+        return bucket
+
+    def _totals(self, second):
+        oldest = second - self.window + 1
+        requests = retries = 0
+        for bucket_second, bucket_requests, bucket_retries in self._buckets:
+            if bucket_second >= oldest:
+                requests += bucket_requests
+                retries += bucket_retries
+        return requests, retries
+
+    def record_request(self):
+        with self._lock:
+            self._bucket(int(time.monotonic()))[1] += 1
+
+    def try_spend(self):
+        """Take one retry from the budget; False if it is used up."""
+        with self._lock:
+            second = int(time.monotonic())
+            requests, retries = self._totals(second)
+            if retries >= self.min_per_second * self.window + self.ratio * requests:
+                return False
+            self._bucket(second)[2] += 1
+            return True
+
+    def stats(self):
+        with self._lock:
+            requests, retries = self._totals(int(time.monotonic()))
+        return {'window_requests': requests, 'window_retries': retries, 'ratio': self.ratio}
+
+
+class LatencyTracker:
+    """Recent successful call latencies of one upstream and their percentile."""
+
+    def __init__(self, percentile=HEDGE_PERCENTILE, min_samples=HEDGE_MIN_SAMPLES,
+                 size=1000, refresh_every=50):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.refresh_every = refresh_every
+        self._samples = deque(maxlen=size)
+        self._recorded = 0
+        self._value = None
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self._recorded += 1
+            # Sorting on every call would cost more than the hedge saves
+            if len(self._samples) >= self.min_samples and (
+                    self._value is None or self._recorded % self.refresh_every == 0):
+                samples = sorted(self._samples)
+                index = min(len(samples) - 1, int(self.percentile / 100.0 * len(samples)))
+                self._value = samples[index]
+
+    def value(self):
+        return self._value
+
+
+def _never_sent(error):
+    # Refused or timed out while connecting: the upstream never saw the request
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(error, requests.exceptions.ConnectionError) and isinstance(reason, NewConnectionError)
+
+
+def _discard(future):
+    # Close the connection of a response nobody is going to read
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+class Retrier:
+    """Calls an UpstreamClient with retries and, optionally, hedging.
+
+    GET, HEAD and OPTIONS are retried after connection errors, timeouts and
+    502/503/504 answers, with jittered exponential backoff. PUT and DELETE
+    are retried only if the connection to the upstream could not be made;
+    other methods are never retried. Calls the
+    gateway refused itself (open circuit, full bulkhead) are not retried.
+    Every retry and hedge spends from the shared RetryBudget, so a struggling
+    upstream gets a bounded amount of extra load rather than a multiple of it.
+    """
+
+    def __init__(self, budget=None, attempts=RETRY_ATTEMPTS, backoff=RETRY_BACKOFF,
+                 backoff_max=RETRY_BACKOFF_MAX, hedge=HEDGE_ENABLED, hedge_min_delay=HEDGE_MIN_DELAY,
+                 hedge_workers=HEDGE_WORKERS):
+        self.budget = budget or RetryBudget()
+        self.attempts = attempts
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.trackers = {}
+        self._executor = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix='hedge') if hedge else None
+        self._lock = threading.Lock()
+        self.counters = {
+            'retries': 0,
+            'retries_denied': 0,
+            'hedges': 0,
+            'hedges_won': 0,
+            'hedges_denied': 0
+        }
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _tracker(self, name):
+        tracker = self.trackers.get(name)
+        if tracker is None:
+            with self._lock:
+                tracker = self.trackers.setdefault(name, LatencyTracker())
+        return tracker
+
+    def _spend(self, denied):
+        if self.budget.try_spend():
+            return True
+        self._count(denied)
+        return False
+
+    def _timed(self, upstream, method, path, tried, kwargs):
+        start = time.monotonic()
+        response = upstream.request(method, path, tried=tried, **kwargs)
+        if response.status_code < 500:
+            self._tracker(upstream.name).record(time.monotonic() - start)
+        return response
+
+    def _hedged(self, upstream, method, path, tried, kwargs, delay):
+        # Attempts run on executor threads but belong to the caller's trace
+        primary = self._executor.submit(contextvars.copy_context().run, self._timed,
+                                        upstream, method, path, tried, kwargs)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._spend('hedges_denied'):
+            return primary.result()
+
+        self._count('hedges')
+        hedge = self._executor.submit(contextvars.copy_context().run, self._timed,
+                                      upstream, method, path, tried, kwargs)
+        pending = {primary, hedge}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            succeeded = [future for future in done
+                         if future.exception() is None and future.result().status_code < 500]
+            if succeeded or not pending:
+                winner = succeeded[0] if succeeded else next(iter(done))
+                for other in (done | pending) - {winner}:
+                    other.add_done_callback(_discard)
+                if winner is hedge:
+                    self._count('hedges_won')
+                return winner.result()
+            # The other attempt may still succeed
+            for future in done:
+                _discard(future)
+
+    def _attempt(self, upstream, method, path, tried, kwargs):
+        if self.hedge and method in HEDGE_METHODS:
+            delay = self._tracker(upstream.name).value()
+            if delay is not None:
+                return self._hedged(upstream, method, path, tried, kwargs, max(delay, self.hedge_min_delay))
+        return self._timed(upstream, method, path, tried, kwargs)
+
+    def call(self, upstream, method, path, **kwargs):
+        """Same as upstream.request(method, path, **kwargs), with retries."""
+        if method not in SAFE_METHODS and method not in CONNECT_RETRY_METHODS:
+            return upstream.request(method, path, **kwargs)
+        safe = method in SAFE_METHODS
+
+        self.budget.record_request()
+        # Instances already tried, so retries and hedges go somewhere else
+        tried = []
+        attempt = 1
+        while True:
+            try:
+                response = self._attempt(upstream, method, path, tried, kwargs)
+            except UpstreamRejected:
+                raise
+            except requests.exceptions.RequestException as e:
+                if (not safe and not _never_sent(e)) or attempt >= self.attempts or not self._spend('retries_denied'):
+                    raise
+            else:
+                if (not safe or response.status_code not in RETRY_STATUSES or attempt >= self.attempts
+                        or not self._spend('retries_denied')):
+                    return response
+                response.close()
+
+            self._count('retries')
+            time.sleep(random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt)))
+            attempt += 1
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        hedge_delays = {}
+        for name, tracker in list(self.trackers.items()):
+            value = tracker.value()
+            hedge_delays[name] = round(max(value, self.hedge_min_delay) * 1000, 1) if value is not None else None
+        return dict(counters, budget=self.budget.stats(), hedging=self.hedge, hedge_delay_ms=hedge_delays)
+
+
+def create_retrier():
+    if not RETRY_ENABLED:
+        return None
+    return Retrier()
@@ -0,0 +1,200 @@
+import json
+import os
+import threading
+import time
+
+# Service URLs
+USER_SERVICE_URL = os.environ.get('USER_SERVICE_URL', 'http://localhost:5001')
+PRODUCT_SERVICE_URL = os.environ.get('PRODUCT_SERVICE_URL', 'http://localhost:5002')
+ORDER_SERVICE_URL = os.environ.get('ORDER_SERVICE_URL', 'http://localhost:5003')
+NOTIFICATION_SERVICE_URL = os.environ.get('NOTIFICATION_SERVICE_URL', 'http://localhost:5004')
+
+SERVICE_URLS = {
+    'user': USER_SERVICE_URL,
+    'product': PRODUCT_SERVICE_URL,
+    'order': ORDER_SERVICE_URL,
+    'notification': NOTIFICATION_SERVICE_URL
+}
+
+SUPPORTED_METHODS = ['GET', 'POST', 'PUT', 'DELETE']
+
+# Declarative route table. A path uses the upstream, methods and cache
+# settings of its longest matching prefix; "public" lists the methods that
+# don't require authentication and applies to every path under the prefix.
+# "cache" enables the edge cache for anonymous GETs on public routes: "ttl"
+# seconds fresh, then "stale" more seconds served while revalidating.
+# "rate_limit" gives each client a token bucket for the route: "rate" tokens
+# per second, holding at most "burst".
+DEFAULT_ROUTES = [
+    {'prefix': '/api/auth', 'upstream': 'user'},
+    {'prefix': '/api/auth/login', 'public': ['GET']},
+    {'prefix': '/api/auth/register', 'public': ['GET']},
+    {'prefix': '/api/users', 'upstream': 'user'},
+    {'prefix': '/api/products', 'upstream': 'product', 'public': ['GET'], 'cache': {'ttl': 30, 'stale': 30},
+     'rate_limit': {'rate': 20, 'burst': 40}},
+    {'prefix': '/api/categories', 'upstream': 'product', 'public': ['GET'], 'cache': {'ttl': 300, 'stale': 60}},
+    {'prefix': '/api/inventory', 'upstream': 'product'},
+    {'prefix': '/api/orders', 'upstream': 'order'},
+    {'prefix': '/api/notifications', 'upstream': 'notification'}
+]
+
+# Optional JSON file with a route list in the same format; it is re-read
+# when it changes, at most once every ROUTES_RELOAD_INTERVAL seconds
+ROUTES_FILE = os.environ.get('GATEWAY_ROUTES_FILE')
+ROUTES_RELOAD_INTERVAL = float(os.environ.get('GATEWAY_ROUTES_RELOAD_INTERVAL', 5))
+
+
+class Route:
+    __slots__ = ('prefix', 'upstream', 'methods', 'public_methods', 'cache_ttl', 'stale_ttl', 'rate_limit')
+
+    def __init__(self, prefix, upstream, methods, public_methods, cache_ttl=0, stale_ttl=0, rate_limit=None):
+        self.prefix = prefix
+        self.upstream = upstream
+        self.methods = methods
+        self.public_methods = public_methods
+        self.cache_ttl = cache_ttl
+        self.stale_ttl = stale_ttl
+        self.rate_limit = rate_limit
+
+    def allows(self, method):
+        return method in self.methods
+
+    def requires_auth(self, method):
+        return method not in self.public_methods
+
+
+class _Node:
+    __slots__ = ('children', 'route')
+
+    def __init__(self):
+        self.children = {}
+        self.route = None
+
+
+def compile_routes(routes, services=None):
+    """Compile a route list into a prefix trie.
+
+    Every terminal node holds a fully resolved Route, so a lookup is a single
+    walk down the path with no second pass over the public routes.
+    """
+    services = SERVICE_URLS if services is None else services
+    root = _Node()
+
+    for entry in routes:
+        prefix = entry['prefix']
+        upstream = entry.get('upstream')
+        if upstream is not None and upstream not in services:
+            raise ValueError(f"Unknown upstream '{upstream}' for route {prefix}")
+        methods = entry.get('methods')
+        if methods is not None and set(methods) - set(SUPPORTED_METHODS):
+            raise ValueError(f"Unsupported methods for route {prefix}: {methods}")
+
+        node = root
+        for char in prefix:
+            node = node.children.setdefault(char, _Node())
+        if node.route is not None:
+            raise ValueError(f"Duplicate route {prefix}")
+        node.route = entry
+
+    # Resolve inheritance top-down: upstream and methods come from the
+    # nearest prefix that sets them, public methods accumulate
+    def resolve(node, prefix, inherited):
+        if node.route is not None:
+            entry = node.route
+            upstream = entry.get('upstream', inherited.upstream if inherited else None)
+            methods = entry.get('methods')
+            if methods is None:
+                methods = inherited.methods if inherited else frozenset(SUPPORTED_METHODS)
+            public_methods = frozenset(entry.get('public', ()))
+            if inherited:
+                public_methods |= inherited.public_methods
+            cache = entry.get('cache')
+            if cache is not None:
+                cache_ttl, stale_ttl = float(cache.get('ttl', 0)), float(cache.get('stale', 0))
+            elif inherited:
+                cache_ttl, stale_ttl = inherited.cache_ttl, inherited.stale_ttl
+            else:
+                cache_ttl, stale_ttl = 0, 0
+            limit = entry.get('rate_limit')
+            if limit is not None:
+                rate = float(limit['rate'])
+                rate_limit = (rate, float(limit.get('burst', rate))) if rate > 0 else None
+            else:
+                rate_limit = inherited.rate_limit if inherited else None
+            inherited = Route(prefix, upstream, frozenset(methods), public_methods,
+                              cache_ttl, stale_ttl, rate_limit)
+            node.route = inherited if upstream is not None else None
+        for char, child in node.children.items():
+            resolve(child, prefix + char, inherited)
+
+    resolve(root, '', None)
+    return root
+
+
+def _lookup(root, path):
+    node = root
+    match = root.route
+    for char in path:
+        node = node.children.get(char)
+        if node is None:
+            break
+        if node.route is not None:
+            match = node.route
+    return match
+
+
+def _load_routes(path):
+    with open(path) as f:
+        data = json.load(f)
+    return data['routes'] if isinstance(data, dict) else data
+
+
+class RouteTable:
+    def __init__(self, routes=DEFAULT_ROUTES, routes_file=None, reload_interval=ROUTES_RELOAD_INTERVAL):
+        self.routes_file = routes_file
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = time.monotonic()
+        self._root = compile_routes(routes)
+        if routes_file:
+            self.reload()
+
+    def lookup(self, path):
+        """Return the Route for path, or None when no upstream serves it."""
+        if self.routes_file and time.monotonic() - self._checked_at >= self.reload_interval:
+            self._check_file()
+        return _lookup(self._root, path)
+
+    def load(self, routes):
+        # Compile first so a bad table never replaces a working one
+        self._root = compile_routes(routes)
+
+    def reload(self):
+        """Re-read the routes file. Returns True if a new table was installed."""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                self._mtime = os.path.getmtime(self.routes_file)
+                self.load(_load_routes(self.routes_file))
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"Error loading routes from {self.routes_file}: {str(e)}")
+                return False
+            return True
+
+    def _check_file(self):
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._checked_at = time.monotonic()
+            try:
+                mtime = os.path.getmtime(self.routes_file)
+            except OSError:
+                return
+        finally:
+            self._lock.release()
+        if mtime != self._mtime:
+            self.reload()
+
+
+ROUTE_TABLE = RouteTable(routes_file=ROUTES_FILE)
@@ -0,0 +1,298 @@
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.poolmanager import PoolManager
+
+from balancer import LoadBalancer, parse_instances
+from breaker import Bulkhead, BulkheadFullError, CircuitBreaker, CircuitOpenError
+from metrics import count_rejection, observe_upstream, outcome, watch_upstream
+
+
+def _env(name, default, cast=str):
+    value = os.environ.get(name)
+    if value is None or value == '':
+        return default
+    if cast is bool:
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return cast(value)
+
+
+# Defaults shared by every upstream; each one can be overridden per service
+# with e.g. ORDER_SERVICE_READ_TIMEOUT or PRODUCT_SERVICE_POOL_SIZE
+POOL_SIZE = _env('UPSTREAM_POOL_SIZE', 20, int)
+POOL_BLOCK = _env('UPSTREAM_POOL_BLOCK', False, bool)
+KEEPALIVE = _env('UPSTREAM_KEEPALIVE', True, bool)
+CONNECT_TIMEOUT = _env('UPSTREAM_CONNECT_TIMEOUT', 3.05, float)
+READ_TIMEOUT = _env('UPSTREAM_READ_TIMEOUT', 30.0, float)
+MAX_IN_FLIGHT = _env('UPSTREAM_MAX_IN_FLIGHT', 100, int)
+
+# Circuit breaker defaults, overridable per service the same way
+# (e.g. ORDER_SERVICE_BREAKER_OPEN_SECONDS)
+BREAKER_WINDOW = _env('BREAKER_WINDOW', 50, int)
+BREAKER_MIN_CALLS = _env('BREAKER_MIN_CALLS', 20, int)
+BREAKER_FAILURE_RATE = _env('BREAKER_FAILURE_RATE', 0.5, float)
+BREAKER_SLOW_CALL_SECONDS = _env('BREAKER_SLOW_CALL_SECONDS', 5.0, float)
+BREAKER_SLOW_CALL_RATE = _env('BREAKER_SLOW_CALL_RATE', 0.5, float)
+BREAKER_OPEN_SECONDS = _env('BREAKER_OPEN_SECONDS', 30.0, float)
+BREAKER_HALF_OPEN_CALLS = _env('BREAKER_HALF_OPEN_CALLS', 3, int)
+
+# Service URL settings may list several instances separated by commas
+LB_STRATEGY = _env('UPSTREAM_LB_STRATEGY', 'p2c')
+EJECT_AFTER_FAILURES = _env('UPSTREAM_EJECT_AFTER_FAILURES', 5, int)
+EJECT_SECONDS = _env('UPSTREAM_EJECT_SECONDS', 30.0, float)
+
+# Values of the upstream_circuit_state gauge
+CIRCUIT_STATE_VALUES = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+
+
+def upstream_settings(name):
+    """Pool and timeout settings for one upstream, with per-service overrides."""
+    prefix = f"{name.upper()}_SERVICE_"
+    return {
+        'pool_size': _env(prefix + 'POOL_SIZE', POOL_SIZE, int),
+        'pool_block': _env(prefix + 'POOL_BLOCK', POOL_BLOCK, bool),
+        'keepalive': _env(prefix + 'KEEPALIVE', KEEPALIVE, bool),
+        'connect_timeout': _env(prefix + 'CONNECT_TIMEOUT', CONNECT_TIMEOUT, float),
+        'read_timeout': _env(prefix + 'READ_TIMEOUT', READ_TIMEOUT, float)
+    }
+
+
+def breaker_settings(name):
+    """Circuit breaker thresholds for one upstream, with per-service overrides."""
+    prefix = f"{name.upper()}_SERVICE_BREAKER_"
+    return {
+        'window': _env(prefix + 'WINDOW', BREAKER_WINDOW, int),
+        'min_calls': _env(prefix + 'MIN_CALLS', BREAKER_MIN_CALLS, int),
+        'failure_rate': _env(prefix + 'FAILURE_RATE', BREAKER_FAILURE_RATE, float),
+        'slow_call_seconds': _env(prefix + 'SLOW_CALL_SECONDS', BREAKER_SLOW_CALL_SECONDS, float),
+        'slow_call_rate': _env(prefix + 'SLOW_CALL_RATE', BREAKER_SLOW_CALL_RATE, float),
+        'open_seconds': _env(prefix + 'OPEN_SECONDS', BREAKER_OPEN_SECONDS, float),
+        'half_open_calls': _env(prefix + 'HALF_OPEN_CALLS', BREAKER_HALF_OPEN_CALLS, int)
+    }
+
+
+def balancer_settings(name):
+    """Instance selection and ejection settings for one upstream."""
+    prefix = f"{name.upper()}_SERVICE_"
+    return {
+        'strategy': _env(prefix + 'LB_STRATEGY', LB_STRATEGY),
+        'eject_after': _env(prefix + 'EJECT_AFTER_FAILURES', EJECT_AFTER_FAILURES, int),
+        'eject_seconds': _env(prefix + 'EJECT_SECONDS', EJECT_SECONDS, float)
+    }
+
+
+class PoolCounters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, reused):
+        with self._lock:
+            if reused:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+
+class _CountingPoolMixin:
+    counters = None
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout=timeout)
+        # A connection without a live socket has to dial the upstream again
+        if self.counters is not None:
+            self.counters.record(getattr(conn, 'sock', None) is not None)
+        return conn
+
+
+class _CountingHTTPConnectionPool(_CountingPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _CountingHTTPSConnectionPool(_CountingPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class _CountingPoolManager(PoolManager):
+    def __init__(self, *args, counters=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.counters = counters
+        self.pool_classes_by_scheme = {
+            'http': _CountingHTTPConnectionPool,
+            'https': _CountingHTTPSConnectionPool,
+        }
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        pool = super()._new_pool(scheme, host, port, request_context=request_context)
+        pool.counters = self.counters
+        return pool
+
+
+class _CountingAdapter(HTTPAdapter):
+    def __init__(self, counters, **kwargs):
+        self.counters = counters
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = _CountingPoolManager(
+            num_pools=connections,
+            maxsize=maxsize,
+            block=block,
+            counters=self.counters,
+            **pool_kwargs
+        )
+
+
+class UpstreamClient:
+    """Pooled keep-alive HTTP client for one upstream service, which may
+    run as several instances (base_url is then a comma separated list)."""
+
+    def __init__(self, name, base_url, pool_size=POOL_SIZE, pool_block=POOL_BLOCK,
+                 keepalive=KEEPALIVE, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 max_in_flight=MAX_IN_FLIGHT, breaker=None, balancer=None):
+        self.name = name
+        self.balancer = balancer or LoadBalancer(parse_instances(base_url))
+        self.pool_size = pool_size
+        self.keepalive = keepalive
+        self.timeout = (connect_timeout, read_timeout)
+        self.counters = PoolCounters()
+        self.breaker = breaker or CircuitBreaker()
+        self.bulkhead = Bulkhead(max_in_flight)
+        self.rejections = {'circuit_open': 0, 'bulkhead_full': 0}
+        self._lock = threading.Lock()
+
+        self.session = requests.Session()
+        # Don't pick up proxies or netrc from the environment on every call
+        self.session.trust_env = False
+        adapter = _CountingAdapter(
+            self.counters,
+            pool_connections=len(self.balancer.instances),
+            pool_maxsize=pool_size,
+            pool_block=pool_block
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if not keepalive:
+            self.session.headers['Connection'] = 'close'
+
+        watch_upstream(name, lambda: CIRCUIT_STATE_VALUES[self.breaker.state], lambda: self.bulkhead.in_flight)
+
+    @classmethod
+    def from_env(cls, name, base_url):
+        return cls(
+            name,
+            base_url,
+            max_in_flight=_env(f"{name.upper()}_SERVICE_MAX_IN_FLIGHT", MAX_IN_FLIGHT, int),
+            breaker=CircuitBreaker(**breaker_settings(name)),
+            balancer=LoadBalancer(parse_instances(base_url), **balancer_settings(name)),
+            **upstream_settings(name)
+        )
+
+    def _reject(self, kind, error):
+        with self._lock:
+            self.rejections[kind] += 1
+        count_rejection(self.name, kind)
+        raise error
+
+    def _release_on_close(self, response, release):
+        # A streamed body is still being read after request() returns; the
+        # call keeps its bulkhead slot and instance until it is closed
+        close = response.close
+        lock = threading.Lock()
+        released = []
+
+        def close_and_release():
+            close()
+            with lock:
+                if released:
+                    return
+                released.append(True)
+            release()
+
+        response.close = close_and_release
+
+    def _send(self, method, url, kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            observe_upstream(self.name, method, 'error', time.perf_counter() - start)
+            raise
+        observe_upstream(self.name, method, outcome(response.status_code), time.perf_counter() - start)
+        return response
+
+    def request(self, method, path, guard=True, instance=None, tried=None, **kwargs):
+        """Call the upstream. Unless guard is False, the call goes through
+        the bulkhead and circuit breaker and may raise UpstreamRejected.
+        Pass instance to skip load balancing and call that instance. A tried
+        list gets the chosen instance appended, and the balancer avoids the
+        instances already in it. A streamed response (stream=True) holds its
+        bulkhead slot and instance until it is closed."""
+        kwargs.setdefault('timeout', self.timeout)
+        if not guard:
+            instance = instance or self.balancer.instances[0]
+            return self._send(method, f"{instance.url}{path}", kwargs)
+
+        if not self.bulkhead.acquire():
+            self._reject('bulkhead_full', BulkheadFullError(f"Too many in-flight requests to {self.name}"))
+        released = False
+        try:
+            if not self.breaker.allow():
+                self._reject('circuit_open', CircuitOpenError(f"Circuit open for {self.name}"))
+
+            if instance is None:
+                instance = self.balancer.acquire(avoid=tried)
+                balanced = True
+                if tried is not None:
+                    tried.append(instance)
+            else:
+                balanced = False
+            start = time.monotonic()
+            success = False
+            response = None
+            try:
+                response = self._send(method, f"{instance.url}{path}", kwargs)
+                success = response.status_code < 500
+                return response
+            finally:
+                duration = time.monotonic() - start
+                self.breaker.record(success, duration)
+
+                def release():
+                    if balanced:
+                        self.balancer.release(instance, success, duration)
+                    self.bulkhead.release()
+
+                if response is not None and kwargs.get('stream'):
+                    self._release_on_close(response, release)
+                else:
+                    release()
+                released = True
+        finally:
+            # Rejected by the breaker, or no instance to call
+            if not released:
+                self.bulkhead.release()
+
+    def stats(self):
+        return {
+            'strategy': self.balancer.strategy,
+            'instances': self.balancer.stats(),
+            'pool_size': self.pool_size,
+            'keepalive': self.keepalive,
+            'connect_timeout': self.timeout[0],
+            'read_timeout': self.timeout[1],
+            'pool_hits': self.counters.hits,
+            'pool_misses': self.counters.misses,
+            'max_in_flight': self.bulkhead.max_in_flight,
+            'in_flight': self.bulkhead.in_flight,
+            'rejections': dict(self.rejections),
+            'breaker': self.breaker.stats()
+        }
@@ -13,10 +13,15 @@ import resend
 from dotenv import load_dotenv
 from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail
+from tracing import init_tracing, trace_span
+from metrics import init_metrics
+from pagination import InvalidPage, count_total, keyset_page
 
 load_dotenv()
 
 app = Flask(__name__)
+init_metrics(app)
+init_tracing(app, 'notification_service')
 
 # Configure database
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///notifications.db')
@@ -37,6 +42,11 @@ class Notification(db.Model):
     sent = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     
+    # Newest first listing per user and type, for cursor pagination
+    __table_args__ = (
+        db.Index('ix_notification_user_id_type_created_at_id', 'user_id', 'type', 'created_at', 'id'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -134,7 +144,11 @@ def send_email_sendgrid(to_email, subject, html_content):
             return False
             
         sg = SendGridAPIClient(sendgrid_api_key)
-        response = sg.send(message)
+        # SendGrid's client doesn't use requests, so it is traced here
+        with trace_span('POST api.sendgrid.com/v3/mail/send', 'CLIENT') as span:
+            response = sg.send(message)
+            if span is not None:
+                span.tag('http.status_code', response.status_code)
         
         print(f"SendGrid API response status code: {response.status_code}")
         
@@ -558,6 +572,7 @@ def get_user_notifications(current_user_id):
     read_status = request.args.get('read')
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)
+    cursor = request.args.get('cursor')
     
     query = Notification.query.filter_by(user_id=current_user_id, type=notification_type)
     
@@ -565,6 +580,27 @@ def get_user_notifications(current_user_id):
         is_read = read_status.lower() == 'true'
         query = query.filter_by(is_read=is_read)
     
+    # Any cursor parameter (empty for the first page) switches to cursor
+    # pagination; total=exact or total=estimate adds a total
+    if cursor is not None:
+        try:
+            notifications, next_cursor = keyset_page(
+                query, [Notification.created_at, Notification.id], cursor, per_page, True, 'notifications'
+            )
+        except InvalidPage as e:
+            return jsonify({'message': str(e)}), 400
+        
+        result = {
+            'items': [notification.to_dict() for notification in notifications],
+            'next_cursor': next_cursor,
+            'per_page': per_page,
+            'unread_count': Notification.query.filter_by(user_id=current_user_id, type=notification_type, is_read=False).count()
+        }
+        if request.args.get('total'):
+            result['total'] = count_total(query, request.args.get('total'))
+        
+        return jsonify(result), 200
+    
     notifications = query.order_by(Notification.created_at.desc()).paginate(page=page, per_page=per_page)
     
     result = {
@@ -0,0 +1,103 @@
+import base64
+import datetime
+import json
+
+from sqlalchemy import DateTime, tuple_
+
+# Keyset (cursor) pagination: each page continues after the sort key of the
+# last row of the previous one, with a WHERE on an index instead of an
+# OFFSET scan, and without the COUNT(*) that page numbers need. The cursor
+# handed to clients is the sort key, base64 encoded, and only meant to be
+# passed back as it is.
+#
+# Every service keeps an identical copy of this file, since each one is
+# built from its own directory.
+
+
+class InvalidPage(ValueError):
+    pass
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+def encode_cursor(name, values):
+    payload = [name] + [value.isoformat() if isinstance(value, datetime.datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, name, keys):
+    """Sort key values of a cursor made by encode_cursor(name, ...) for keys."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        raise InvalidCursor('Invalid cursor')
+    # A cursor only means something for the order it was made in
+    if not isinstance(payload, list) or len(payload) != len(keys) + 1 or payload[0] != name:
+        raise InvalidCursor('Cursor does not match this listing')
+    values = []
+    for key, value in zip(keys, payload[1:]):
+        # Only what encode_cursor writes; anything else would reach the
+        # database as a bind parameter
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (str, int, float))):
+            raise InvalidCursor('Invalid cursor')
+        if value is not None and isinstance(key.type, DateTime):
+            try:
+                value = datetime.datetime.fromisoformat(value)
+            except (TypeError, ValueError):
+                raise InvalidCursor('Invalid cursor')
+        values.append(value)
+    return values
+
+
+def keyset_page(query, keys, cursor=None, per_page=10, descending=False, name=''):
+    """One page of query ordered by keys, and the cursor of the next page.
+
+    keys are the columns to sort by, ending with a unique one (the primary
+    key), all in the same direction so a row value comparison can use one
+    index on them. name tells listings (or sorts of one listing) apart, so
+    a cursor from one isn't accepted by another. None or '' as the cursor
+    is the first page. Returns (items, next_cursor); next_cursor is None
+    on the last page. Raises InvalidPage for a per_page below 1 and
+    InvalidCursor for a cursor that doesn't decode.
+    """
+    if per_page < 1:
+        raise InvalidPage('per_page must be at least 1')
+    if cursor:
+        values = decode_cursor(cursor, name, keys)
+        position = tuple_(*keys)
+        after = tuple_(*values)
+        query = query.filter(position < after if descending else position > after)
+    query = query.order_by(*[key.desc() if descending else key.asc() for key in keys])
+    # One extra row tells whether there is a next page
+    items = query.limit(per_page + 1).all()
+    next_cursor = None
+    if items and len(items) > per_page:
+        items = items[:per_page]
+        next_cursor = encode_cursor(name, [getattr(items[-1], key.key) for key in keys])
+    return items, next_cursor
+
+
+def estimate_count(query):
+    """The planner's row estimate for query on Postgres, without running
+    it; None on other databases."""
+    session = query.session
+    connection = session.connection()
+    if connection.dialect.name != 'postgresql':
+        return None
+    compiled = query.order_by(None).statement.compile(dialect=connection.dialect)
+    plan = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + compiled.string, compiled.params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count_total(query, mode):
+    """Total for a cursor listing: 'exact' counts, 'estimate' asks the
+    planner (falling back to None), anything else is None."""
+    if mode == 'exact':
+        return query.order_by(None).count()
+    if mode == 'estimate':
+        return estimate_count(query)
+    return None
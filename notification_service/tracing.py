@@ -0,0 +1,290 @@
+import atexit
+import contextlib
+import contextvars
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+
+from flask import current_app, g, request
+
+# Distributed tracing with W3C trace context (the traceparent header).
+# Every request handled becomes a SERVER span, continuing the caller's
+# trace; every outbound requests call and database query inside it becomes
+# a child span, and outbound calls carry traceparent on to the next service.
+# Spans are written as Zipkin v2 JSON, one per line, to TRACE_FILE, or sent
+# to a Zipkin compatible collector (Zipkin, Jaeger, OpenTelemetry Collector).
+#
+# Every service keeps an identical copy of this file, since each one is
+# built from its own directory.
+TRACING_ENABLED = os.environ.get('TRACING_ENABLED', 'true').lower() in ('1', 'true', 'yes', 'on')
+# 'file', 'collector' or 'none'. Nothing is exported unless asked for:
+# the file exporter has no rotation or size cap, so it is meant for local
+# runs, and a collector has to exist. Trace context is propagated either way.
+TRACE_EXPORTER = os.environ.get('TRACE_EXPORTER', 'none')
+TRACE_FILE = os.environ.get('TRACE_FILE', 'traces.jsonl')
+TRACE_COLLECTOR_URL = os.environ.get('TRACE_COLLECTOR_URL', 'http://localhost:9411/api/v2/spans')
+# Share of new traces that are recorded; callers' decisions are kept
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', 1.0))
+TRACE_FLUSH_INTERVAL = float(os.environ.get('TRACE_FLUSH_INTERVAL', 1.0))
+TRACE_QUEUE_SIZE = int(os.environ.get('TRACE_QUEUE_SIZE', 10000))
+TRACE_MAX_STATEMENT = 500
+
+TRACEPARENT_RE = re.compile(r'^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})')
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    __slots__ = ('service', 'trace_id', 'span_id', 'parent_id', 'name', 'kind', 'sampled',
+                 'tags', 'timestamp', '_start', '_token')
+
+    def __init__(self, service, name, kind=None, trace_id=None, parent_id=None, sampled=True, tags=None):
+        self.service = service
+        self.trace_id = trace_id or '%032x' % random.getrandbits(128)
+        self.span_id = '%016x' % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.sampled = sampled
+        self.tags = tags or {}
+        self.timestamp = time.time()
+        self._start = time.perf_counter()
+        self._token = None
+
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def tag(self, key, value):
+        self.tags[key] = str(value)
+
+    def activate(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def finish(self, error=None):
+        duration = time.perf_counter() - self._start
+        if self._token is not None:
+            _current_span.reset(self._token)
+            self._token = None
+        if error is not None:
+            self.tags['error'] = str(error) or type(error).__name__
+        if self.sampled and _exporter is not None:
+            _exporter.submit(self, duration)
+
+    def __enter__(self):
+        return self.activate()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish(exc)
+
+    def to_zipkin(self, duration):
+        span = {
+            'traceId': self.trace_id,
+            'id': self.span_id,
+            'name': self.name,
+            'timestamp': int(self.timestamp * 1e6),
+            'duration': max(int(duration * 1e6), 1),
+            'localEndpoint': {'serviceName': self.service},
+            'tags': self.tags
+        }
+        if self.parent_id:
+            span['parentId'] = self.parent_id
+        if self.kind:
+            span['kind'] = self.kind
+        return span
+
+
+def parse_traceparent(value):
+    """Return (trace_id, parent_id, sampled) from a traceparent header, or None."""
+    match = TRACEPARENT_RE.match((value or '').strip().lower())
+    if match is None:
+        return None
+    version, trace_id, parent_id, flags = match.groups()
+    if version == 'ff' or trace_id == '0' * 32 or parent_id == '0' * 16:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+
+def current_span():
+    return _current_span.get()
+
+
+def start_span(name, kind=None, tags=None):
+    """Child span of the current one, for use as a context manager; None
+    outside of a trace. Spans don't start traces of their own, so
+    background work like health probes isn't traced."""
+    parent = _current_span.get()
+    if parent is None:
+        return None
+    return Span(parent.service, name, kind, parent.trace_id, parent.span_id, parent.sampled, tags)
+
+
+def trace_span(name, kind=None, tags=None):
+    """start_span that can always be used in a with statement; it gives
+    None instead of a span outside of a trace."""
+    return start_span(name, kind, tags) or contextlib.nullcontext()
+
+
+class _Exporter:
+    # Spans are queued and written by a background thread, so a slow disk
+    # or collector never holds up a request. A full queue drops spans.
+
+    def __init__(self, exporter, path, url):
+        self.exporter = exporter
+        self.path = path
+        self.url = url
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+        self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def submit(self, span, duration):
+        try:
+            self._queue.put_nowait(span.to_zipkin(duration))
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self):
+        spans = []
+        while True:
+            try:
+                spans.append(self._queue.get_nowait())
+            except queue.Empty:
+                return spans
+
+    def _write(self, spans):
+        if self.exporter == 'collector':
+            body = json.dumps(spans).encode('utf-8')
+            post = urllib.request.Request(self.url, data=body, headers={'Content-Type': 'application/json'})
+            with urllib.request.urlopen(post, timeout=5) as response:
+                response.read()
+        else:
+            with open(self.path, 'a') as sink:
+                sink.write(''.join(json.dumps(span) + '\n' for span in spans))
+
+    def flush(self):
+        spans = self._drain()
+        if not spans:
+            return
+        try:
+            self._write(spans)
+        except Exception as e:
+            print(f"Error exporting {len(spans)} spans: {str(e)}")
+
+    def _run(self):
+        while True:
+            time.sleep(TRACE_FLUSH_INTERVAL)
+            self.flush()
+
+
+_exporter = None
+_instrumented = False
+
+
+def _before_request():
+    parent = _current_span.get()
+    if parent is not None:
+        # A request dispatched inside another one (gateway batch items)
+        trace_id, parent_id, sampled = parent.trace_id, parent.span_id, parent.sampled
+    else:
+        context = parse_traceparent(request.headers.get('traceparent'))
+        if context is not None:
+            trace_id, parent_id, sampled = context
+        else:
+            trace_id, parent_id, sampled = None, None, random.random() < TRACE_SAMPLE_RATE
+    rule = request.url_rule.rule if request.url_rule is not None else request.path
+    span = Span(current_app.extensions['tracing'], f"{request.method} {rule}", 'SERVER',
+                trace_id, parent_id, sampled, {'http.method': request.method, 'http.path': request.path})
+    g.trace_span = span.activate()
+
+
+def _after_request(response):
+    span = g.get('trace_span')
+    if span is not None:
+        span.tag('http.status_code', response.status_code)
+    return response
+
+
+def _teardown_request(error):
+    span = g.pop('trace_span', None)
+    if span is not None:
+        span.finish(error)
+
+
+def _instrument_requests():
+    import requests
+
+    send = requests.Session.send
+
+    def traced_send(session, prepared, **kwargs):
+        span = start_span(f"{prepared.method} {prepared.url.split('?', 1)[0]}", 'CLIENT',
+                          {'http.method': prepared.method, 'http.url': prepared.url})
+        if span is None:
+            return send(session, prepared, **kwargs)
+        # Replaces any traceparent copied over from the incoming request
+        prepared.headers['traceparent'] = span.traceparent()
+        with span:
+            response = send(session, prepared, **kwargs)
+            span.tag('http.status_code', response.status_code)
+            return response
+
+    requests.Session.send = traced_send
+
+
+def _instrument_sqlalchemy():
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        span = start_span(statement.split(None, 1)[0].upper() if statement else 'query', 'CLIENT',
+                          {'db.system': conn.dialect.name, 'db.statement': statement[:TRACE_MAX_STATEMENT]})
+        if span is not None:
+            context._trace_span = span.activate()
+
+    @event.listens_for(Engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        span = getattr(context, '_trace_span', None)
+        if span is not None:
+            context._trace_span = None
+            span.finish()
+
+    @event.listens_for(Engine, 'handle_error')
+    def handle_error(exception_context):
+        span = getattr(exception_context.execution_context, '_trace_span', None)
+        if span is not None:
+            exception_context.execution_context._trace_span = None
+            span.finish(exception_context.original_exception)
+
+
+def init_tracing(app, service):
+    """Trace every request of app as service, along with its outbound
+    requests calls and SQLAlchemy queries."""
+    global _exporter, _instrumented
+    if not TRACING_ENABLED:
+        return
+    if _exporter is None and TRACE_EXPORTER != 'none':
+        _exporter = _Exporter(TRACE_EXPORTER, TRACE_FILE, TRACE_COLLECTOR_URL)
+    if not _instrumented:
+        _instrumented = True
+        # Either library is optional; a service that doesn't use it has
+        # nothing of it to trace
+        try:
+            _instrument_requests()
+        except ImportError:
+            pass
+        try:
+            _instrument_sqlalchemy()
+        except ImportError:
+            pass
+
+    app.extensions['tracing'] = service
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
@@ -2,13 +2,18 @@ from flask import Flask, request, jsonify
 import os
 import uuid
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import selectinload
 import datetime
-import requests
 import jwt
 from functools import wraps
 import json
+from tracing import init_tracing
+from metrics import init_metrics, timed_request
+from pagination import InvalidPage, count_total, keyset_page
 
 app = Flask(__name__)
+init_metrics(app)
+init_tracing(app, 'order_payment_service')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///orders.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'dev_secret_key')
@@ -33,6 +38,13 @@ class Order(db.Model):
     
     items = db.relationship('OrderItem', backref='order', cascade='all, delete-orphan')
     
+    # Newest first listings, for cursor pagination
+    __table_args__ = (
+        db.Index('ix_order_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+        db.Index('ix_order_status_created_at_id', 'status', 'created_at', 'id'),
+        db.Index('ix_order_created_at_id', 'created_at', 'id'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -111,7 +123,9 @@ def token_required(f):
 # Helper function to send notification
 def send_notification(user_id, notification_type, data):
     try:
-        response = requests.post(
+        response = timed_request(
+            'notification',
+            'POST',
             f"{NOTIFICATION_SERVICE_URL}/api/notifications",
             json={
                 'user_id': user_id,
@@ -125,6 +139,57 @@ def send_notification(user_id, notification_type, data):
         print(f"Error sending notification: {str(e)}")
         return False
 
+def finish_reservation(reservation_id, action):
+    # Commit or release an inventory reservation made for an order
+    try:
+        response = timed_request(
+            'product',
+            'POST',
+            f"{PRODUCT_SERVICE_URL}/api/inventory/reservations/{reservation_id}/{action}",
+            headers={'Authorization': request.headers.get('Authorization')},
+            timeout=5
+        )
+        if response.status_code != 200:
+            print(f"Error finishing reservation {reservation_id} ({action}): {response.json().get('message')}")
+        return response.status_code == 200
+    except Exception as e:
+        # An unfinished hold expires on its own
+        print(f"Error finishing reservation {reservation_id} ({action}): {str(e)}")
+        return False
+
+def reservation_status(reservation_id):
+    # Status of an inventory reservation, None if it can't be read
+    try:
+        response = timed_request(
+            'product',
+            'GET',
+            f"{PRODUCT_SERVICE_URL}/api/inventory/reservations/{reservation_id}",
+            headers={'Authorization': request.headers.get('Authorization')},
+            timeout=5
+        )
+        if response.status_code == 200:
+            return response.json().get('status')
+    except Exception as e:
+        print(f"Error reading reservation {reservation_id}: {str(e)}")
+    return None
+
+def order_cursor_page(query, cursor, per_page):
+    # Newest first, continuing after cursor; total=exact or total=estimate adds a total
+    try:
+        orders, next_cursor = keyset_page(query, [Order.created_at, Order.id], cursor, per_page, True, 'orders')
+    except InvalidPage as e:
+        return jsonify({'message': str(e)}), 400
+    
+    result = {
+        'items': [order.to_dict() for order in orders],
+        'next_cursor': next_cursor,
+        'per_page': per_page
+    }
+    if request.args.get('total'):
+        result['total'] = count_total(query, request.args.get('total'))
+    
+    return jsonify(result), 200
+
 # Routes
 @app.route('/api/orders', methods=['POST'])
 @token_required
@@ -134,78 +199,100 @@ def create_order(current_user_id):
     if not data or not data.get('items') or not data.get('shipping_address') or not data.get('payment_method'):
         return jsonify({'message': 'Missing required fields'}), 400
     
-    # Validate inventory
-    items_to_check = [{'product_id': item['product_id'], 'quantity': item['quantity']} for item in data['items']]
+    # Hold the stock while the order is written and paid for: nobody else can
+    # take it in between, and it is given back if this checkout never finishes
     try:
-        inventory_response = requests.post(
-            f"{PRODUCT_SERVICE_URL}/api/inventory/check",
-            json={'items': items_to_check},
+        reservation_response = timed_request(
+            'product',
+            'POST',
+            f"{PRODUCT_SERVICE_URL}/api/inventory/reservations",
+            headers={'Authorization': request.headers.get('Authorization')},
+            json={'items': [{'product_id': item['product_id'], 'quantity': item['quantity']} for item in data['items']]},
             timeout=5
         )
-        inventory_data = inventory_response.json()
-        
-        # Check if all items are available
-        for item in inventory_data:
-            if not item['available']:
-                return jsonify({'message': item['message']}), 400
     except Exception as e:
-        print(f"Error checking inventory: {str(e)}")
-        return jsonify({'message': 'Error checking inventory'}), 500
+        print(f"Error reserving inventory: {str(e)}")
+        return jsonify({'message': 'Error reserving inventory'}), 502
+    
+    if reservation_response.status_code >= 500:
+        print(f"Error reserving inventory: status {reservation_response.status_code}")
+        return jsonify({'message': 'Inventory service unavailable'}), 503
+    try:
+        reservation_data = reservation_response.json()
+    except ValueError:
+        reservation_data = {}
+    if reservation_response.status_code != 201:
+        # Out of stock or invalid items; the product service says which
+        return jsonify({'message': reservation_data.get('message', 'Error reserving inventory')}), reservation_response.status_code
+    reservation_id = reservation_data['id']
     
     # Calculate total amount
     total_amount = sum(item['price'] * item['quantity'] for item in data['items'])
     
-    # Create new order
-    new_order = Order(
-        user_id=current_user_id,
-        total_amount=total_amount,
-        shipping_address=data['shipping_address'],
-        billing_address=data.get('billing_address', data['shipping_address']),
-        payment_method=data['payment_method']
-    )
-    
-    # Add order items
-    for item in data['items']:
-        new_order.items.append(OrderItem(
-            product_id=item['product_id'],
-            product_name=item['product_name'],
-            quantity=item['quantity'],
-            price=item['price']
-        ))
-    
-    db.session.add(new_order)
-    
-    # Create payment record
-    payment = Payment(
-        order_id=new_order.id,
-        amount=total_amount,
-        payment_method=data['payment_method']
-    )
-    
-    db.session.add(payment)
-    db.session.commit()
+    try:
+        # Create new order
+        new_order = Order(
+            user_id=current_user_id,
+            total_amount=total_amount,
+            shipping_address=data['shipping_address'],
+            billing_address=data.get('billing_address', data['shipping_address']),
+            payment_method=data['payment_method']
+        )
+        
+        # Add order items
+        for item in data['items']:
+            new_order.items.append(OrderItem(
+                product_id=item['product_id'],
+                product_name=item['product_name'],
+                quantity=item['quantity'],
+                price=item['price']
+            ))
+        
+        db.session.add(new_order)
+        
+        # Create payment record
+        payment = Payment(
+            order=new_order,
+            amount=total_amount,
+            payment_method=data['payment_method']
+        )
+        
+        db.session.add(payment)
+        db.session.commit()
+    except Exception as e:
+        # Don't keep the stock held until the reservation expires
+        db.session.rollback()
+        print(f"Error creating order: {str(e)}")
+        finish_reservation(reservation_id, 'release')
+        return jsonify({'message': 'Error creating order'}), 500
     
     # Process payment
     # In a real application, this would integrate with a payment gateway like Stripe
     payment_successful = True
     
+    # The held units are sold only if the hold is still there; once it has
+    # expired they may have gone to someone else. A commit that timed out
+    # may still have gone through, so ask before giving up on it.
+    committed = payment_successful and (
+        finish_reservation(reservation_id, 'commit') or reservation_status(reservation_id) == 'committed'
+    )
+    if payment_successful and not committed:
+        finish_reservation(reservation_id, 'release')
+        # A real payment gateway would void the charge here
+        payment.status = 'failed'
+        new_order.status = 'cancelled'
+        db.session.commit()
+        return jsonify({
+            'message': 'Items are no longer reserved, the order was cancelled',
+            'order': new_order.to_dict(),
+            'payment': payment.to_dict()
+        }), 409
+    
     if payment_successful:
         payment.status = 'completed'
         payment.transaction_id = str(uuid.uuid4())  # This would be the transaction ID from the payment gateway
         new_order.status = 'processing'
         
-        # Update inventory
-        try:
-            requests.post(
-                f"{PRODUCT_SERVICE_URL}/api/inventory/update",
-                headers={'Authorization': request.headers.get('Authorization')},
-                json={'items': [{'product_id': item['product_id'], 'quantity': item['quantity'], 'operation': 'decrease'} for item in data['items']]},
-                timeout=5
-            )
-        except Exception as e:
-            # Log error, but don't fail the order
-            print(f"Error updating inventory: {str(e)}")
-        
         # Send notification
         send_notification(
             current_user_id,
@@ -219,6 +306,7 @@ def create_order(current_user_id):
     else:
         payment.status = 'failed'
         new_order.status = 'cancelled'
+        finish_reservation(reservation_id, 'release')
     
     db.session.commit()
     
@@ -232,8 +320,16 @@ def create_order(current_user_id):
 def get_user_orders(current_user_id):
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)
+    cursor = request.args.get('cursor')
+    
+    # Items of the whole page in one more query, not one query per order
+    query = Order.query.options(selectinload(Order.items)).filter_by(user_id=current_user_id)
     
-    orders = Order.query.filter_by(user_id=current_user_id).order_by(Order.created_at.desc()).paginate(page=page, per_page=per_page)
+    # Any cursor parameter (empty for the first page) switches to cursor pagination
+    if cursor is not None:
+        return order_cursor_page(query, cursor, per_page)
+    
+    orders = query.order_by(Order.created_at.desc()).paginate(page=page, per_page=per_page)
     
     result = {
         'items': [order.to_dict() for order in orders.items],
@@ -279,7 +375,9 @@ def cancel_order(current_user_id, order_id):
     
     # Restore inventory
     try:
-        requests.post(
+        timed_request(
+            'product',
+            'POST',
             f"{PRODUCT_SERVICE_URL}/api/inventory/update",
             headers={'Authorization': request.headers.get('Authorization')},
             json={'items': [{'product_id': item.product_id, 'quantity': item.quantity, 'operation': 'increase'} for item in order.items]},
@@ -312,12 +410,17 @@ def get_all_orders(current_user_id):
     status = request.args.get('status')
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
+    cursor = request.args.get('cursor')
     
-    query = Order.query
+    # Items of the whole page in one more query, not one query per order
+    query = Order.query.options(selectinload(Order.items))
     
     if status:
         query = query.filter_by(status=status)
     
+    if cursor is not None:
+        return order_cursor_page(query, cursor, per_page)
+    
     orders = query.order_by(Order.created_at.desc()).paginate(page=page, per_page=per_page)
     
     result = {
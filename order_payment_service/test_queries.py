@@ -0,0 +1,67 @@
+import os
+import tempfile
+
+import jwt
+import pytest
+
+os.environ.setdefault('METRICS_ENABLED', 'false')
+os.environ.setdefault('TRACING_ENABLED', 'false')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test_queries.db'))
+
+import app as service
+from query_count import assert_max_queries
+
+# Query count budget of the order endpoints: a listing must not run more
+# queries as its page grows (no lazy load of the items of each order). A
+# test over budget fails with the statements the endpoint ran.
+#
+#   pip install pytest && python -m pytest test_queries.py
+
+USER_ID = 'test-queries-user'
+ORDERS = 20
+ITEMS_PER_ORDER = 3
+
+# (path, query string, most queries allowed)
+CHECKS = [
+    ('/api/orders', {'per_page': ORDERS}, 3),                           # count, page and items
+    ('/api/orders', {'per_page': ORDERS, 'cursor': ''}, 2),
+    ('/api/orders', {'per_page': ORDERS, 'cursor': '', 'total': 'exact'}, 3),
+    ('/api/admin/orders', {'per_page': ORDERS}, 3),
+    ('/api/admin/orders', {'per_page': ORDERS, 'status': 'pending'}, 3),
+    ('/api/admin/orders', {'per_page': ORDERS, 'cursor': ''}, 2)
+]
+
+
+@pytest.fixture(scope='module')
+def engine():
+    with service.app.app_context():
+        service.db.drop_all()
+        service.db.create_all()
+        for i in range(ORDERS):
+            order = service.Order(
+                user_id=USER_ID,
+                status='pending',
+                total_amount=30.0,
+                shipping_address='1 Main St',
+                billing_address='1 Main St',
+                payment_method='credit_card'
+            )
+            for j in range(ITEMS_PER_ORDER):
+                order.items.append(service.OrderItem(
+                    product_id=f"product-{j}",
+                    product_name=f"Product {j}",
+                    quantity=1,
+                    price=10.0
+                ))
+            service.db.session.add(order)
+        service.db.session.commit()
+        return service.db.engine
+
+
+@pytest.mark.parametrize('path, query_string, limit', CHECKS)
+def test_listing_queries(engine, path, query_string, limit):
+    token = jwt.encode({'user_id': USER_ID}, service.app.config['JWT_SECRET_KEY'], algorithm='HS256')
+    headers = {'Authorization': f"Bearer {token}"}
+    with assert_max_queries(limit, engine, f"GET {path} {query_string}"):
+        response = service.app.test_client().get(path, query_string=query_string, headers=headers)
+    assert response.status_code == 200
@@ -0,0 +1,121 @@
+import argparse
+import os
+import tempfile
+import time
+
+# Only the cache path is measured
+os.environ.setdefault('METRICS_ENABLED', 'false')
+os.environ.setdefault('TRACING_ENABLED', 'false')
+# Redis tier first; the in-process tier is measured separately below
+os.environ.setdefault('CACHE_LOCAL_ENABLED', 'false')
+os.environ.setdefault('SEARCH_ENGINE_ENABLED', 'false')
+os.environ.setdefault('RESERVATION_SWEEP_ENABLED', 'false')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'bench_cache.db'))
+
+import redis
+from flask import jsonify
+from werkzeug.test import EnvironBuilder
+
+import app as service
+from cache import LocalCache
+
+# Latency of a product listing cache hit: the previous str()/eval() and
+# jsonify path against cached response bytes from Redis and from the
+# in-process tier, for a few page sizes. fakeredis answers in-process, so
+# against it the in-process tier saves less than a network round trip.
+#
+#   REDIS_HOST=localhost python bench_cache.py
+#   python bench_cache.py --fake      # in-process fakeredis, no server needed
+
+
+def legacy_products(client):
+    # The hit path as it was: repr() in Redis, eval() and jsonify on a hit
+    def view():
+        per_page = service.request.args.get('per_page', 10, type=int)
+        cached_result = client.get(f"legacy:products:{per_page}")
+        if cached_result:
+            return jsonify(eval(cached_result)), 200
+        return jsonify({'message': 'miss'}), 500
+    return view
+
+
+def seed(count):
+    with service.app.app_context():
+        service.db.drop_all()
+        service.db.create_all()
+        service.db.session.add(service.Category(id='bench', name='Electronics'))
+        for i in range(count):
+            service.db.session.add(service.Product(
+                name=f"Product {i:04d}",
+                description='Fast, light and built to last. ' * 8,
+                price=10.0 + i,
+                stock=100,
+                category_id='bench'
+            ))
+        service.db.session.commit()
+
+
+def run(environ, total):
+    def start_response(status, headers, exc_info=None):
+        pass
+
+    start = time.perf_counter()
+    for _ in range(total):
+        body = service.app.wsgi_app(dict(environ), start_response)
+        for _ in body:
+            pass
+        body.close()
+    return (time.perf_counter() - start) / total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare product cache hit paths')
+    parser.add_argument('--fake', action='store_true', help='use fakeredis instead of a Redis server')
+    parser.add_argument('--requests', type=int, default=3000)
+    parser.add_argument('--page-sizes', type=int, nargs='+', default=[10, 50, 100])
+    args = parser.parse_args()
+
+    if args.fake:
+        import fakeredis
+        server = fakeredis.FakeServer()
+        binary = fakeredis.FakeRedis(server=server)
+        text = fakeredis.FakeRedis(server=server, decode_responses=True)
+    else:
+        kwargs = {'host': os.environ.get('REDIS_HOST', 'localhost'), 'port': int(os.environ.get('REDIS_PORT', 6379))}
+        binary = redis.Redis(**kwargs)
+        text = redis.Redis(decode_responses=True, **kwargs)
+    service.redis_client = binary
+    service.response_cache.client = binary
+    service.app.add_url_rule('/bench/legacy/products', 'bench_legacy', legacy_products(text))
+
+    seed(max(args.page_sizes))
+    client = service.app.test_client()
+    for per_page in args.page_sizes:
+        # Fill both caches
+        result = client.get(f"/api/products?per_page={per_page}").get_json()
+        text.setex(f"legacy:products:{per_page}", 300, str(result))
+        stored = binary.get(f"products:::name:1:{per_page}|json")
+
+        print(f"per_page={per_page}: {len(str(result))} bytes as str(), {len(stored)} bytes stored")
+        cases = [
+            ('str/eval + jsonify', {'path': '/bench/legacy/products', 'query_string': {'per_page': per_page}}),
+            ('cached bytes', {'path': '/api/products', 'query_string': {'per_page': per_page}}),
+            ('cached bytes, gzip', {'path': '/api/products', 'query_string': {'per_page': per_page},
+                                    'headers': {'Accept-Encoding': 'gzip'}})
+        ]
+        for label, request_args in cases:
+            environ = EnvironBuilder(**request_args).get_environ()
+            run(environ, 100)
+            per_request = run(environ, args.requests)
+            print(f"  {label:<22} {per_request * 1e6:>9.1f} us/hit")
+
+        service.response_cache.local = LocalCache(ttl=3600)
+        environ = EnvironBuilder(**cases[1][1]).get_environ()
+        run(environ, 100)
+        per_request = run(environ, args.requests)
+        print(f"  {'in-process tier':<22} {per_request * 1e6:>9.1f} us/hit")
+        service.response_cache.local = None
+
+
+if __name__ == '__main__':
+    main()
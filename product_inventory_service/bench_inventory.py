@@ -0,0 +1,105 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+import uuid
+
+os.environ.setdefault('METRICS_ENABLED', 'false')
+os.environ.setdefault('TRACING_ENABLED', 'false')
+os.environ.setdefault('SEARCH_ENGINE_ENABLED', 'false')
+os.environ.setdefault('RESERVATION_SWEEP_ENABLED', 'false')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'bench_inventory.db'))
+
+from flask import jsonify
+
+import app as service
+from query_count import count_queries
+
+# Latency of /api/inventory/check by basket size: the previous per-item
+# Query.get loop against the single WHERE id IN (...) query. Against SQLite
+# a query is an in-process call; against a database over the network every
+# saved query is also a saved round trip.
+#
+#   python bench_inventory.py
+#   DATABASE_URL=postgresql://... python bench_inventory.py
+
+PRODUCTS = 10000
+
+
+def legacy_check_inventory():
+    # check_inventory as it was
+    data = service.request.get_json()
+    result = []
+    for item in data['items']:
+        product_id = item.get('product_id')
+        quantity = item.get('quantity', 1)
+        product = service.Product.query.get(product_id)
+        if not product:
+            result.append({'product_id': product_id, 'available': False, 'message': 'Product not found'})
+        elif product.stock < quantity:
+            result.append({'product_id': product_id, 'available': False,
+                           'message': f'Insufficient stock. Available: {product.stock}'})
+        else:
+            result.append({'product_id': product_id, 'available': True, 'message': 'In stock'})
+    return jsonify(result), 200
+
+
+def seed():
+    with service.app.app_context():
+        service.db.drop_all()
+        service.db.create_all()
+        service.db.session.add(service.Category(id='bench', name='Electronics'))
+        rows = [{
+            'id': str(uuid.uuid4()),
+            'name': f"Product {i:05d}",
+            'description': 'Benchmark product',
+            'price': 10.0,
+            'stock': 50,
+            'category_id': 'bench'
+        } for i in range(PRODUCTS)]
+        service.db.session.execute(service.Product.__table__.insert(), rows)
+        service.db.session.commit()
+        return [row['id'] for row in rows], service.db.engine
+
+
+def timed(client, path, body, repeat):
+    client.post(path, json=body)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        response = client.post(path, json=body)
+    return (time.perf_counter() - start) / repeat, response.get_json()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare inventory check implementations')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    product_ids, engine = seed()
+    service.app.add_url_rule('/bench/legacy/inventory/check', 'bench_legacy_check',
+                             legacy_check_inventory, methods=['POST'])
+    client = service.app.test_client()
+    rng = random.Random(7)
+
+    for size in args.sizes:
+        items = [{'product_id': product_id, 'quantity': rng.randint(1, 60)}
+                 for product_id in rng.sample(product_ids, size)]
+        body = {'items': items}
+        repeat = max(3, args.repeat * 10 // max(size, 10))
+
+        with count_queries(engine) as legacy_queries:
+            client.post('/bench/legacy/inventory/check', json=body)
+        with count_queries(engine) as set_queries:
+            client.post('/api/inventory/check', json=body)
+        legacy_time, legacy_result = timed(client, '/bench/legacy/inventory/check', body, repeat)
+        set_time, set_result = timed(client, '/api/inventory/check', body, repeat)
+        assert legacy_result == set_result
+
+        print(f"{size:>5} items   per item {legacy_time * 1000:>8.2f} ms ({legacy_queries.count} queries)   "
+              f"one query {set_time * 1000:>7.2f} ms ({set_queries.count} queries)   x{legacy_time / set_time:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+import jwt
+
+os.environ.setdefault('METRICS_ENABLED', 'false')
+os.environ.setdefault('TRACING_ENABLED', 'false')
+os.environ.setdefault('SEARCH_ENGINE_ENABLED', 'false')
+os.environ.setdefault('RESERVATION_SWEEP_ENABLED', 'false')
+os.environ.setdefault('CACHE_LOCAL_ENABLED', 'false')
+os.environ.setdefault('RESERVATION_SWEEP_INTERVAL', '0.2')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'bench_reservations.db'))
+
+import app as service
+
+# A flash sale: many threads reserving a few hot products at once, then
+# committing (paid), releasing (payment failed) or abandoning the hold
+# (closed tab), which the sweeper gives back once it expires. Afterwards
+# every unit must be either sold or back in stock, with nothing held and
+# nothing sold twice; a monitor checks that holds never exceed stock.
+#
+#   python bench_reservations.py --fake
+#   DATABASE_URL=postgresql://... REDIS_HOST=localhost python bench_reservations.py
+
+
+def seed(products, stock):
+    with service.app.app_context():
+        service.db.drop_all()
+        service.db.create_all()
+        service.db.session.add(service.Category(id='bench', name='Electronics'))
+        for i in range(products):
+            service.db.session.add(service.Product(id=f"hot-{i:03d}", name=f"Hot product {i}", price=10.0,
+                                                   stock=stock, category_id='bench'))
+        service.db.session.commit()
+
+
+def inventory():
+    with service.app.app_context():
+        return {row.id: (row.stock, row.reserved) for row in
+                service.db.session.query(service.Product.id, service.Product.stock, service.Product.reserved)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reservations under flash-sale concurrency')
+    parser.add_argument('--fake', action='store_true', help='use fakeredis instead of a Redis server')
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--checkouts', type=int, default=100, help='per thread')
+    parser.add_argument('--products', type=int, default=3)
+    parser.add_argument('--stock', type=int, default=200)
+    parser.add_argument('--abandon', type=float, default=0.15, help='share of holds left to expire')
+    parser.add_argument('--release', type=float, default=0.15, help='share of holds released')
+    parser.add_argument('--ttl', type=int, default=1, help='ttl of the holds, in seconds')
+    args = parser.parse_args()
+
+    if args.fake:
+        import fakeredis
+        service.response_cache.client = fakeredis.FakeRedis()
+
+    seed(args.products, args.stock)
+    service.start_reservation_sweeper()
+    token = jwt.encode({'user_id': 'bench'}, service.app.config['JWT_SECRET_KEY'], algorithm='HS256')
+    headers = {'Authorization': f"Bearer {token}"}
+    product_ids = [f"hot-{i:03d}" for i in range(args.products)]
+
+    sold = {product_id: 0 for product_id in product_ids}
+    counts = {'committed': 0, 'released': 0, 'abandoned': 0, 'out of stock': 0, 'expired': 0, 'errors': 0}
+    violations = []
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def monitor():
+        while not done.is_set():
+            for product_id, (stock, reserved) in inventory().items():
+                if stock < 0 or reserved < 0 or reserved > stock:
+                    violations.append((product_id, stock, reserved))
+            time.sleep(0.05)
+
+    def worker(seed_value):
+        rng = random.Random(seed_value)
+        client = service.app.test_client()
+        for _ in range(args.checkouts):
+            basket = rng.sample(product_ids, rng.randint(1, min(2, args.products)))
+            items = [{'product_id': product_id, 'quantity': rng.randint(1, 2)} for product_id in basket]
+            response = client.post('/api/inventory/reservations', json={'items': items, 'ttl': args.ttl},
+                                   headers=headers)
+            if response.status_code != 201:
+                with lock:
+                    counts['out of stock' if response.status_code == 400 else 'errors'] += 1
+                continue
+            reservation_id = response.get_json()['id']
+            outcome = rng.random()
+            if outcome < args.abandon:
+                with lock:
+                    counts['abandoned'] += 1
+                continue
+            action = 'release' if outcome < args.abandon + args.release else 'commit'
+            response = client.post(f"/api/inventory/reservations/{reservation_id}/{action}", headers=headers)
+            with lock:
+                if response.status_code == 200 and action == 'commit':
+                    counts['committed'] += 1
+                    for item in items:
+                        sold[item['product_id']] += item['quantity']
+                elif response.status_code == 200:
+                    counts['released'] += 1
+                elif response.status_code == 409:
+                    counts['expired'] += 1
+                else:
+                    counts['errors'] += 1
+
+    monitor_thread = threading.Thread(target=monitor, daemon=True)
+    monitor_thread.start()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    # Let the abandoned holds expire and be swept
+    time.sleep(args.ttl + 1)
+    done.set()
+    monitor_thread.join()
+
+    final = inventory()
+    attempts = args.threads * args.checkouts
+    print(f"{args.threads} threads x {args.checkouts} checkouts over {args.products} products "
+          f"of {args.stock} units ({os.environ['DATABASE_URL'].split(':')[0]})")
+    print(f"  {attempts / elapsed:.0f} checkouts/s   " + ', '.join(f"{count} {name}" for name, count in counts.items()))
+    for product_id in product_ids:
+        stock, reserved = final[product_id]
+        print(f"  {product_id}: sold {sold[product_id]}, stock {stock}, held {reserved}, "
+              f"unaccounted {args.stock - sold[product_id] - stock}")
+    print(f"  holds above stock seen by the monitor: {len(violations)}")
+
+
+if __name__ == '__main__':
+    main()
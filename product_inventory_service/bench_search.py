@@ -0,0 +1,161 @@
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import time
+import uuid
+
+os.environ.setdefault('METRICS_ENABLED', 'false')
+os.environ.setdefault('TRACING_ENABLED', 'false')
+os.environ.setdefault('CACHE_LOCAL_ENABLED', 'false')
+os.environ.setdefault('SEARCH_ENGINE_ENABLED', 'false')
+os.environ.setdefault('RESERVATION_SWEEP_ENABLED', 'false')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'bench_search.db'))
+
+from sqlalchemy import func, text
+
+import app as service
+from search import create_search_index, search_products
+from search_engine import SearchEngine
+
+# Product search at catalog scale: the previous ILIKE '%term%' filter
+# against the full-text index, in the shape get_products runs it (a count
+# and the first page of 10), and the in-memory search engine's lookup of
+# the same page (ids only, before the rows are loaded by primary key).
+#
+#   python bench_search.py                       # SQLite FTS5, 1M products
+#   DATABASE_URL=postgresql://... python bench_search.py --products 1000000
+#   python bench_search.py --reuse               # keep the last seeded table
+
+ADJECTIVES = ['wireless', 'portable', 'compact', 'ergonomic', 'waterproof', 'smart', 'classic', 'premium',
+              'lightweight', 'rechargeable', 'vintage', 'organic', 'stainless', 'foldable', 'magnetic']
+NOUNS = ['headphones', 'speaker', 'keyboard', 'backpack', 'kettle', 'blender', 'jacket', 'lamp', 'watch',
+         'camera', 'charger', 'notebook', 'bottle', 'drone', 'tent', 'mouse', 'monitor', 'router']
+DETAILS = ['with noise cancellation', 'with long battery life', 'made from recycled materials',
+           'for travel and outdoor use', 'with a two year warranty', 'in a gift box', 'with fast charging',
+           'built for everyday use', 'with adjustable settings', 'that fits in any bag']
+# A rare word, one in about 10k products
+RARE = 'titanium'
+
+TERMS = ['headphones', 'wireless speaker', RARE, 'noise cancellation', 'zzzz']
+# Typos only the in-memory engine matches
+FUZZY_TERMS = ['headphnoes', 'wireles speakr', 'titanum']
+
+
+def seed(count, batch=10000):
+    rng = random.Random(42)
+    categories = ['Electronics', 'Clothing', 'Home & Kitchen', 'Books', 'Toys']
+    now = datetime.datetime.utcnow()
+    with service.app.app_context():
+        # drop_all leaves the FTS5 table, indexing the rows being dropped
+        if service.db.engine.dialect.name == 'sqlite':
+            service.db.session.execute(text('DROP TABLE IF EXISTS product_fts'))
+            service.db.session.commit()
+        service.db.drop_all()
+        service.db.create_all()
+        for name in categories:
+            service.db.session.add(service.Category(id=name, name=name))
+        service.db.session.commit()
+
+        table = service.Product.__table__
+        for start in range(0, count, batch):
+            rows = []
+            for _ in range(min(batch, count - start)):
+                adjective, noun = rng.choice(ADJECTIVES), rng.choice(NOUNS)
+                if rng.random() < 0.0001:
+                    adjective = RARE
+                rows.append({
+                    'id': str(uuid.uuid4()),
+                    'name': f"{adjective.title()} {noun.title()} {rng.randint(100, 9999)}",
+                    'description': f"A {adjective} {noun} {rng.choice(DETAILS)} and {rng.choice(DETAILS)}.",
+                    'price': round(rng.uniform(5, 500), 2),
+                    'stock': rng.randint(0, 500),
+                    'category_id': rng.choice(categories),
+                    'created_at': now,
+                    'updated_at': now
+                })
+            service.db.session.execute(table.insert(), rows)
+            service.db.session.commit()
+
+
+def ilike_page(term):
+    # get_products' search as it was
+    pattern = f"%{term}%"
+    query = service.Product.query.filter(
+        service.Product.name.ilike(pattern) | service.Product.description.ilike(pattern)
+    ).order_by(service.Product.name)
+    page = query.paginate(page=1, per_page=10, error_out=False)
+    return page.total, [product.name for product in page.items]
+
+
+def indexed_page(term):
+    query, rank = search_products(service.Product.query, term)
+    page = query.order_by(rank, service.Product.name).paginate(page=1, per_page=10, error_out=False)
+    return page.total, [product.name for product in page.items]
+
+
+def timed(function, term, repeat):
+    function(term)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function(term)
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare ILIKE and full-text product search')
+    parser.add_argument('--products', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--reuse', action='store_true', help='skip seeding if the table already has --products rows')
+    parser.add_argument('--no-engine', action='store_true', help='skip the in-memory search engine')
+    args = parser.parse_args()
+
+    with service.app.app_context():
+        engine = service.db.engine
+        existing = 0
+        if args.reuse:
+            try:
+                existing = service.db.session.query(func.count(service.Product.id)).scalar()
+            except Exception:
+                service.db.session.rollback()
+    if existing != args.products:
+        start = time.perf_counter()
+        seed(args.products)
+        print(f"seeded {args.products} products in {time.perf_counter() - start:.1f}s")
+
+    with service.app.app_context():
+        start = time.perf_counter()
+        create_search_index(engine)
+        print(f"{engine.dialect.name}: search index ready in {time.perf_counter() - start:.1f}s")
+
+        in_memory = None
+        if not args.no_engine:
+            in_memory = SearchEngine()
+            start = time.perf_counter()
+            in_memory.build(service.search_documents())
+            stats = in_memory.stats()
+            print(f"search engine built in {time.perf_counter() - start:.1f}s: {stats['terms']} terms, "
+                  f"{stats['posting_bytes'] / 1e6:.1f} MB of postings")
+
+        for term in TERMS:
+            ilike_time, (ilike_total, _) = timed(ilike_page, term, args.repeat)
+            index_time, (index_total, top) = timed(indexed_page, term, args.repeat)
+            line = (f"{term!r:<22} ILIKE {ilike_time * 1000:>9.1f} ms ({ilike_total} rows)   "
+                    f"index {index_time * 1000:>8.1f} ms ({index_total} rows)")
+            if in_memory is not None:
+                engine_time, (engine_total, _) = timed(in_memory.search, term, args.repeat)
+                line += f"   engine {engine_time * 1000:>8.2f} ms ({engine_total} rows)"
+            print(line)
+            if top:
+                print(f"{'':<22} best match: {top[0]}")
+
+        if in_memory is not None:
+            for term in FUZZY_TERMS:
+                engine_time, (engine_total, product_ids) = timed(in_memory.search, term, args.repeat)
+                best = service.db.session.get(service.Product, product_ids[0]).name if product_ids else None
+                print(f"{term!r:<22} engine {engine_time * 1000:>8.2f} ms ({engine_total} rows), best match: {best}")
+
+
+if __name__ == '__main__':
+    main()
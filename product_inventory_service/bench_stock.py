@@ -0,0 +1,142 @@
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+import jwt
+
+os.environ.setdefault('METRICS_ENABLED', 'false')
+os.environ.setdefault('TRACING_ENABLED', 'false')
+os.environ.setdefault('SEARCH_ENGINE_ENABLED', 'false')
+os.environ.setdefault('RESERVATION_SWEEP_ENABLED', 'false')
+os.environ.setdefault('CACHE_LOCAL_ENABLED', 'false')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'bench_stock.db'))
+
+from flask import jsonify
+
+import app as service
+
+# Concurrent checkouts against a few hot products: the previous
+# read-check-assign update_inventory against the conditional UPDATE. Every
+# thread keeps buying until the stock runs out; afterwards, units sold
+# beyond the initial stock are oversold, and a stock that went down by less
+# than was sold lost updates.
+#
+#   python bench_stock.py --fake
+#   DATABASE_URL=postgresql://... REDIS_HOST=localhost python bench_stock.py
+
+
+def legacy_update_inventory(current_user_id):
+    # update_inventory as it was
+    data = service.request.get_json()
+    items = data['items']
+    success = True
+    message = 'Inventory updated successfully'
+    for item in items:
+        product = service.Product.query.get(item.get('product_id'))
+        quantity = item.get('quantity', 0)
+        if not product:
+            success = False
+            message = f"Product {item.get('product_id')} not found"
+            break
+        if item.get('operation', 'decrease') == 'decrease':
+            if product.stock < quantity:
+                success = False
+                message = f'Insufficient stock for product {product.name}'
+                break
+            product.stock -= quantity
+        else:
+            product.stock += quantity
+    if success:
+        service.db.session.commit()
+    else:
+        service.db.session.rollback()
+    return jsonify({'success': success, 'message': message}), 200 if success else 400
+
+
+def seed(products, stock):
+    with service.app.app_context():
+        service.db.drop_all()
+        service.db.create_all()
+        service.db.session.add(service.Category(id='bench', name='Electronics'))
+        for i in range(products):
+            service.db.session.add(service.Product(id=f"hot-{i:03d}", name=f"Hot product {i}", price=10.0,
+                                                   stock=stock, category_id='bench'))
+        service.db.session.commit()
+
+
+def final_stock():
+    with service.app.app_context():
+        return dict(service.db.session.query(service.Product.id, service.Product.stock).all())
+
+
+def run(path, args, headers):
+    seed(args.products, args.stock)
+    sold = {f"hot-{i:03d}": 0 for i in range(args.products)}
+    counts = {'ok': 0, 'rejected': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def worker(seed_value):
+        rng = random.Random(seed_value)
+        client = service.app.test_client()
+        for _ in range(args.checkouts):
+            basket = rng.sample(sorted(sold), rng.randint(1, min(3, args.products)))
+            items = [{'product_id': product_id, 'quantity': rng.randint(1, 2)} for product_id in basket]
+            response = client.post(path, json={'items': items}, headers=headers)
+            with lock:
+                if response.status_code == 200:
+                    counts['ok'] += 1
+                    for item in items:
+                        sold[item['product_id']] += item['quantity']
+                elif response.status_code == 400:
+                    counts['rejected'] += 1
+                else:
+                    counts['errors'] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    stock = final_stock()
+    oversold = sum(max(0, units - args.stock) for units in sold.values())
+    lost_updates = sum(units - (args.stock - stock[product_id]) for product_id, units in sold.items())
+    total = sum(counts.values())
+    print(f"  {total / elapsed:>7.0f} checkouts/s   {counts['ok']} ok, {counts['rejected']} out of stock, "
+          f"{counts['errors']} errors   sold {sum(sold.values())} of {args.stock * args.products}   "
+          f"oversold {oversold}   lost updates {lost_updates}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent stock decrements, legacy against conditional UPDATE')
+    parser.add_argument('--fake', action='store_true', help='use fakeredis instead of a Redis server')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--checkouts', type=int, default=100, help='per thread')
+    parser.add_argument('--products', type=int, default=5)
+    parser.add_argument('--stock', type=int, default=500)
+    args = parser.parse_args()
+
+    if args.fake:
+        import fakeredis
+        service.response_cache.client = fakeredis.FakeRedis()
+
+    service.app.add_url_rule('/bench/legacy/inventory/update', 'bench_legacy_update',
+                             service.token_required(legacy_update_inventory), methods=['POST'])
+    token = jwt.encode({'user_id': 'bench'}, service.app.config['JWT_SECRET_KEY'], algorithm='HS256')
+    headers = {'Authorization': f"Bearer {token}"}
+
+    print(f"{args.threads} threads x {args.checkouts} checkouts over {args.products} products "
+          f"of {args.stock} units ({os.environ['DATABASE_URL'].split(':')[0]})")
+    print('read, check, assign (previous):')
+    run('/bench/legacy/inventory/update', args, headers)
+    print('conditional UPDATE:')
+    run('/api/inventory/update', args, headers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+import gzip
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+from flask import Response
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional; JSON is always available
+    msgpack = None
+
+# Cached responses are stored as the final response body, so a cache hit
+# is sent as it is, without decoding and re-encoding it. Bodies of at least
+# CACHE_COMPRESS_MIN_SIZE bytes are stored gzipped, and sent that way to
+# clients that accept gzip.
+CACHE_COMPRESS_MIN_SIZE = int(os.environ.get('CACHE_COMPRESS_MIN_SIZE', 1024))
+CACHE_COMPRESS_LEVEL = int(os.environ.get('CACHE_COMPRESS_LEVEL', 6))
+
+# In-process tier in front of Redis, so hits on the hottest keys skip the
+# round trip. Entries live at most CACHE_LOCAL_TTL seconds; invalidations
+# reach every replica over Redis pub/sub well before that.
+CACHE_LOCAL_ENABLED = os.environ.get('CACHE_LOCAL_ENABLED', 'true').lower() in ('1', 'true', 'yes', 'on')
+CACHE_LOCAL_TTL = float(os.environ.get('CACHE_LOCAL_TTL', 5))
+CACHE_LOCAL_MAX_BYTES = int(os.environ.get('CACHE_LOCAL_MAX_BYTES', 32 * 1024 * 1024))
+CACHE_LOCAL_MAX_ENTRIES = int(os.environ.get('CACHE_LOCAL_MAX_ENTRIES', 10000))
+CACHE_INVALIDATION_CHANNEL = os.environ.get('CACHE_INVALIDATION_CHANNEL', 'cache-invalidation')
+
+# Rough per-entry bookkeeping cost so tiny bodies still count toward the limit
+ENTRY_OVERHEAD = 512
+
+# First byte of a stored entry: how the body after it is stored
+RAW = b'\x00'
+GZIP = b'\x01'
+
+
+class JsonCodec:
+    name = 'json'
+    mimetype = 'application/json'
+
+    def encode(self, value):
+        return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+
+class MsgpackCodec:
+    name = 'msgpack'
+    mimetype = 'application/msgpack'
+
+    def encode(self, value):
+        return msgpack.packb(value, use_bin_type=True)
+
+
+CODECS = {'json': JsonCodec()}
+if msgpack is not None:
+    CODECS['msgpack'] = MsgpackCodec()
+
+
+def negotiate_codec(accept):
+    """msgpack for clients that ask for it, JSON for everyone else."""
+    if accept and 'msgpack' in CODECS and ('application/msgpack' in accept or 'application/x-msgpack' in accept):
+        return CODECS['msgpack']
+    return CODECS['json']
+
+
+def accepts_gzip(accept_encoding):
+    if not accept_encoding:
+        return False
+    for part in accept_encoding.lower().split(','):
+        name, _, params = part.strip().partition(';')
+        if name.strip() in ('gzip', '*'):
+            params = params.strip()
+            if not params.startswith('q='):
+                return True
+            try:
+                return float(params[2:]) > 0
+            except ValueError:
+                return False
+    return False
+
+
+class LocalCache:
+    """Size-bounded LRU of stored entries with a TTL, for one process.
+
+    Namespaces have a local generation, bumped by invalidate(), which entries
+    are checked against like the Redis ones. Every invalidation also moves
+    the epoch on: an entry read from Redis before it may already be stale, so
+    put() drops it unless the epoch is still the one seen before the read.
+    """
+
+    def __init__(self, ttl=CACHE_LOCAL_TTL, max_bytes=CACHE_LOCAL_MAX_BYTES, max_entries=CACHE_LOCAL_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        # name -> (expires, namespace, generation, flag, body)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._generations = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    @property
+    def epoch(self):
+        return self._epoch
+
+    def _remove(self, name):
+        entry = self._entries.pop(name, None)
+        if entry is not None:
+            self._bytes -= len(entry[4]) + ENTRY_OVERHEAD
+
+    def get(self, name):
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                return None
+            expires, namespace, generation, flag, body = entry
+            if expires <= time.monotonic() or generation != self._generations.get(namespace, 0):
+                self._remove(name)
+                return None
+            self._entries.move_to_end(name)
+            return flag, body
+
+    def put(self, name, namespace, epoch, flag, body):
+        size = len(body) + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if epoch != self._epoch:
+                return
+            self._remove(name)
+            self._entries[name] = (time.monotonic() + self.ttl, namespace,
+                                   self._generations.get(namespace, 0), flag, body)
+            self._bytes += size
+            while self._bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, namespaces=(), names=()):
+        with self._lock:
+            self._epoch += 1
+            for namespace in namespaces:
+                self._generations[namespace] = self._generations.get(namespace, 0) + 1
+            for name in names:
+                self._remove(name)
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes,
+                    'max_bytes': self.max_bytes, 'max_entries': self.max_entries, 'ttl': self.ttl}
+
+
+class ResponseCache:
+    """Response bodies in Redis, one entry per key and codec, with an
+    optional LocalCache in front.
+
+    Keys can belong to a namespace with a generation counter in Redis.
+    Entries remember the generation they were stored under and only count
+    as hits while it is still current, so invalidate(namespace) drops every
+    entry of the namespace with one INCR; the old entries expire by TTL.
+    invalidate() also publishes what it dropped, and every replica listening
+    (see start_listener) drops the same from its local tier.
+    """
+
+    def __init__(self, client, compress_min_size=CACHE_COMPRESS_MIN_SIZE, compress_level=CACHE_COMPRESS_LEVEL,
+                 local=None, channel=CACHE_INVALIDATION_CHANNEL):
+        self.client = client
+        self.compress_min_size = compress_min_size
+        self.compress_level = compress_level
+        self.local = local
+        self.channel = channel
+        self._listener = None
+        self._lock = threading.Lock()
+        self.counters = {
+            'local_hits': 0,
+            'redis_hits': 0,
+            'misses': 0,
+            'errors': 0,
+            'invalidations_received': 0
+        }
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _key(self, key, codec):
+        return f"{key}|{codec.name}"
+
+    def _generation_key(self, namespace):
+        return f"generation:{namespace}"
+
+    def _new_generation(self, namespace):
+        # Start from the clock rather than 0, so a lost counter can't come
+        # back as a generation that old entries were stored under
+        self.client.set(self._generation_key(namespace), int(time.time() * 1000), nx=True)
+        return self.client.get(self._generation_key(namespace))
+
+    def _response(self, flag, body, codec, accept_encoding):
+        # The codec depends on Accept, so shared caches must key on it too
+        headers = {'Vary': 'Accept'}
+        if flag == GZIP:
+            headers['Vary'] = 'Accept, Accept-Encoding'
+            if accepts_gzip(accept_encoding):
+                headers['Content-Encoding'] = 'gzip'
+            else:
+                body = gzip.decompress(body)
+        return Response(body, status=200, mimetype=codec.mimetype, headers=headers)
+
+    def get(self, key, codec, accept_encoding=None, namespace=None):
+        """Return (response, generation): the cached response for key, or
+        None on a miss, and what to pass to put() after a miss."""
+        name = self._key(key, codec)
+        epoch = None
+        if self.local is not None:
+            # Read before Redis, so an invalidation in between is noticed
+            epoch = self.local.epoch
+            entry = self.local.get(name)
+            if entry is not None:
+                self._count('local_hits')
+                return self._response(entry[0], entry[1], codec, accept_encoding), None
+        try:
+            if namespace is None:
+                generation, stored = b'', self.client.get(name)
+            else:
+                # One round trip for the counter and the entry
+                generation, stored = self.client.mget(self._generation_key(namespace), name)
+                if generation is None:
+                    self._count('misses')
+                    return None, (self._new_generation(namespace), namespace, epoch)
+        except redis.RedisError as e:
+            print(f"Error reading cache: {str(e)}")
+            self._count('errors')
+            return None, None
+        if stored:
+            stored_generation, _, body = stored[1:].partition(b'\n')
+            if stored_generation == generation:
+                self._count('redis_hits')
+                if self.local is not None:
+                    self.local.put(name, namespace, epoch, stored[:1], body)
+                return self._response(stored[:1], body, codec, accept_encoding), None
+        self._count('misses')
+        return None, (generation, namespace, epoch)
+
+    def put(self, key, value, ttl, codec, accept_encoding=None, generation=None):
+        """Encode value, cache it for ttl seconds and return it as a response.
+        generation is the one get() returned; None only skips the cache."""
+        body = codec.encode(value)
+        flag = RAW
+        stored_body = body
+        if len(body) >= self.compress_min_size:
+            # mtime=0 keeps the bytes, and so any ETag derived from them, stable
+            flag = GZIP
+            stored_body = gzip.compress(body, self.compress_level, mtime=0)
+        if generation is not None:
+            redis_generation, namespace, epoch = generation
+            name = self._key(key, codec)
+            try:
+                self.client.setex(name, ttl, flag + redis_generation + b'\n' + stored_body)
+            except redis.RedisError as e:
+                print(f"Error writing cache: {str(e)}")
+            else:
+                if self.local is not None:
+                    self.local.put(name, namespace, epoch, flag, stored_body)
+        if flag == GZIP and not accepts_gzip(accept_encoding):
+            return Response(body, status=200, mimetype=codec.mimetype, headers={'Vary': 'Accept, Accept-Encoding'})
+        return self._response(flag, stored_body, codec, accept_encoding)
+
+    def invalidate(self, namespaces=(), keys=()):
+        """Move namespaces to a new generation and delete keys (in every
+        codec), all in one round trip, and tell the other replicas."""
+        names = [self._key(key, codec) for key in keys for codec in CODECS.values()]
+        if self.local is not None:
+            self.local.invalidate(namespaces, names)
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for namespace in namespaces:
+                pipe.incr(self._generation_key(namespace))
+            if names:
+                pipe.delete(*names)
+            pipe.publish(self.channel, json.dumps({'namespaces': list(namespaces), 'names': names}))
+            pipe.execute()
+        except redis.RedisError as e:
+            print(f"Error invalidating cache: {str(e)}")
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # Invalidations sent while not subscribed are lost, so
+                # nothing cached before (re)subscribing can be trusted
+                self.local.clear()
+                for message in pubsub.listen():
+                    if message['type'] != 'message':
+                        continue
+                    invalidation = json.loads(message['data'])
+                    self.local.invalidate(invalidation.get('namespaces', ()), invalidation.get('names', ()))
+                    self._count('invalidations_received')
+            except (redis.RedisError, ValueError) as e:
+                print(f"Error in cache invalidation listener: {str(e)}")
+                time.sleep(1)
+
+    def start_listener(self):
+        """Apply invalidations published by every replica (this one
+        included) to the local tier, from a background thread."""
+        if self.local is None or self._listener is not None:
+            return
+        self._listener = threading.Thread(target=self._listen, name='cache-invalidation', daemon=True)
+        self._listener.start()
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        lookups = counters['local_hits'] + counters['redis_hits'] + counters['misses'] + counters['errors']
+        # The Redis tier only sees what the local tier missed
+        redis_lookups = lookups - counters['local_hits']
+        stats = dict(counters, lookups=lookups)
+        stats['local_hit_ratio'] = round(counters['local_hits'] / lookups, 4) if lookups else None
+        stats['redis_hit_ratio'] = round(counters['redis_hits'] / redis_lookups, 4) if redis_lookups else None
+        stats['hit_ratio'] = round((counters['local_hits'] + counters['redis_hits']) / lookups, 4) if lookups else None
+        if self.local is not None:
+            stats['local'] = self.local.stats()
+        return stats
+
+
+def create_response_cache(client):
+    local = LocalCache() if CACHE_LOCAL_ENABLED else None
+    return ResponseCache(client, local=local)
@@ -0,0 +1,50 @@
+import contextlib
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Counting the SQL statements a block of code runs, to catch N+1 query
+# regressions (a lazy load per row of a listing) before they ship. Used by
+# the test_queries.py tests.
+#
+# The services that use it keep identical copies of this file, since each
+# one is built from its own directory.
+
+
+class QueryCounter:
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def report(self):
+        return '\n'.join(f"  {i + 1}. {' '.join(statement.split())[:200]}"
+                         for i, statement in enumerate(self.statements))
+
+
+@contextlib.contextmanager
+def count_queries(engine=Engine):
+    """Count the statements run on engine (every engine by default) inside
+    the with block."""
+    counter = QueryCounter()
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        counter.statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+@contextlib.contextmanager
+def assert_max_queries(limit, engine=Engine, label='block'):
+    """Raise AssertionError, listing the statements, if the with block runs
+    more than limit of them."""
+    with count_queries(engine) as counter:
+        yield counter
+    if counter.count > limit:
+        raise AssertionError(f"{label} ran {counter.count} queries, expected at most {limit}:\n{counter.report()}")
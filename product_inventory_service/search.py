@@ -0,0 +1,114 @@
+import os
+import re
+
+from sqlalchemy import bindparam, column, func, literal_column, or_, text
+
+# Full-text search over product names and descriptions, ranked by relevance.
+# Postgres keeps a weighted tsvector in a generated column with a GIN index;
+# SQLite (local setups) keeps an FTS5 table in step with triggers. Both are
+# maintained by the database itself on every insert and update, whichever
+# code writes the row. Other databases, or a database the index wasn't
+# created on, fall back to ILIKE.
+SEARCH_CONFIG = os.environ.get('SEARCH_CONFIG', 'english')
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Name matches count for more than description matches
+POSTGRES_INDEX = [
+    f"""ALTER TABLE product ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(name, '')), 'A') ||
+            setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(description, '')), 'B')
+        ) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_product_search_vector ON product USING GIN (search_vector)"
+]
+
+# External content table: the text stays in product, FTS5 only keeps the
+# index, keyed by product's rowid. A VACUUM can renumber those rowids, so
+# run INSERT INTO product_fts(product_fts) VALUES ('rebuild') after one.
+# Dropping product drops the triggers but not product_fts, so whatever is
+# missing is created again and the index rebuilt.
+SQLITE_OBJECTS = ('product_fts', 'product_fts_insert', 'product_fts_delete', 'product_fts_update')
+SQLITE_INDEX = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5(
+        name, description, content='product', content_rowid='rowid', tokenize='porter unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_insert AFTER INSERT ON product BEGIN
+        INSERT INTO product_fts(rowid, name, description) VALUES (new.rowid, new.name, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_delete AFTER DELETE ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, name, description)
+        VALUES ('delete', old.rowid, old.name, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_update AFTER UPDATE OF name, description ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, name, description)
+        VALUES ('delete', old.rowid, old.name, old.description);
+        INSERT INTO product_fts(rowid, name, description) VALUES (new.rowid, new.name, new.description);
+    END""",
+    "INSERT INTO product_fts(product_fts) VALUES ('rebuild')"
+]
+
+# BM25 column weights for name and description
+SQLITE_WEIGHTS = (10.0, 1.0)
+
+# Dialect of the database the index was created on, once it has been
+_dialect = None
+
+
+def create_search_index(engine):
+    """Create the search index (and index existing products) if it doesn't
+    exist yet. Call after the product table has been created."""
+    global _dialect
+    dialect = engine.dialect.name
+    with engine.begin() as connection:
+        if dialect == 'postgresql':
+            for statement in POSTGRES_INDEX:
+                connection.execute(text(statement))
+        elif dialect == 'sqlite':
+            existing = set(connection.execute(
+                text("SELECT name FROM sqlite_master WHERE name IN :names").bindparams(
+                    bindparam('names', expanding=True)
+                ),
+                {'names': list(SQLITE_OBJECTS)}
+            ).scalars())
+            if existing != set(SQLITE_OBJECTS):
+                for statement in SQLITE_INDEX:
+                    connection.execute(text(statement))
+        else:
+            return
+    _dialect = dialect
+
+
+def _ilike(query, term):
+    pattern = f"%{term}%"
+    return query.filter(or_(literal_column('product.name').ilike(pattern),
+                            literal_column('product.description').ilike(pattern))), None
+
+
+def search_products(query, term):
+    """Filter a Product query to those matching term.
+
+    Returns (query, rank): rank is an expression to order by for the best
+    matches first, or None when the ILIKE fallback was used.
+    """
+    tokens = TOKEN_RE.findall(term)
+    if _dialect is None or not tokens:
+        return _ilike(query, term)
+
+    if _dialect == 'postgresql':
+        # websearch_to_tsquery takes user input as it is ("quoted phrases",
+        # or, -excluded) and never raises on bad syntax
+        tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, term)
+        vector = literal_column('product.search_vector')
+        query = query.filter(vector.op('@@')(tsquery))
+        return query, func.ts_rank_cd(vector, tsquery).desc()
+
+    # Every word must match; quoting keeps FTS5 syntax out of user input
+    match = ' '.join('"' + token + '"' for token in tokens)
+    weights = ', '.join(str(weight) for weight in SQLITE_WEIGHTS)
+    matches = text(
+        f"SELECT rowid, bm25(product_fts, {weights}) AS rank FROM product_fts WHERE product_fts MATCH :match"
+    ).bindparams(match=match).columns(column('rowid'), column('rank')).subquery('product_search')
+    query = query.join(matches, matches.c.rowid == literal_column('product.rowid'))
+    # bm25() is lower for better matches
+    return query, matches.c.rank.asc()
@@ -0,0 +1,415 @@
+import heapq
+import json
+import math
+import os
+import re
+import threading
+import time
+import uuid
+from array import array
+from bisect import bisect_left
+
+import redis
+
+# In-memory search over the catalog: an inverted index of product names,
+# descriptions and categories ranked with BM25, and a trigram index of the
+# vocabulary for typo tolerant matching. Built from the database at startup
+# and kept current from product writes, which every replica hears about over
+# Redis pub/sub.
+SEARCH_ENGINE_ENABLED = os.environ.get('SEARCH_ENGINE_ENABLED', 'true').lower() in ('1', 'true', 'yes', 'on')
+SEARCH_ENGINE_CHANNEL = os.environ.get('SEARCH_ENGINE_CHANNEL', 'search-index')
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# A term in the name counts three times, in the category name twice
+FIELD_WEIGHTS = (3, 1, 2)
+
+# Words this short are only matched exactly
+FUZZY_MIN_LENGTH = 4
+# Score multiplier per edit of a fuzzy match
+FUZZY_PENALTY = 0.5
+# Compact once this share of the documents are deleted or replaced ones
+COMPACT_RATIO = 0.25
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+
+def trigrams(term):
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_edits(term):
+    return 1 if len(term) <= 5 else 2
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance (adjacent transpositions count as
+    one edit), or limit + 1 once it is known to be more than limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class SearchEngine:
+    """Inverted index with BM25 ranking and trigram fuzzy matching.
+
+    Documents live in slots numbered in the order they were added. Posting
+    lists are parallel arrays of slots and weighted term frequencies, so
+    they stay sorted by only ever appending: a changed document gets a new
+    slot and its old one is marked dead, until enough are dead to compact.
+    The trigram index maps trigrams to the ids of the terms containing them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+        self.ready = False
+
+    def _reset(self):
+        # Per slot
+        self._ids = []
+        self._lengths = array('I')
+        # BM25 length normalisation, against the average length when added
+        self._norms = array('f')
+        self._categories = array('H')
+        self._live = bytearray()
+        # product id -> slot
+        self._slots = {}
+        # term -> term id; term id -> (slots, frequencies)
+        self._term_ids = {}
+        self._terms = []
+        self._postings = []
+        # trigram -> term ids
+        self._trigrams = {}
+        self._category_codes = {}
+        self._total_length = 0
+        self._dead = 0
+
+    def _term_id(self, term):
+        term_id = self._term_ids.get(term)
+        if term_id is None:
+            term_id = self._term_ids[term] = len(self._terms)
+            self._terms.append(term)
+            self._postings.append((array('I'), array('H')))
+            for trigram in trigrams(term):
+                self._trigrams.setdefault(trigram, array('I')).append(term_id)
+        return term_id
+
+    def _category_code(self, category):
+        code = self._category_codes.get(category)
+        if code is None:
+            code = self._category_codes[category] = len(self._category_codes)
+        return code
+
+    def _norm(self, length):
+        live = len(self._ids) - self._dead
+        average_length = self._total_length / live if live and self._total_length else max(length, 1)
+        return BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+
+    def _renorm(self):
+        live = len(self._ids) - self._dead
+        if live and self._total_length:
+            average_length = self._total_length / live
+            self._norms = array('f', (BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                                      for length in self._lengths))
+
+    def _kill(self, product_id):
+        slot = self._slots.pop(product_id, None)
+        if slot is not None:
+            self._live[slot] = 0
+            self._total_length -= self._lengths[slot]
+            self._dead += 1
+
+    def _add(self, product_id, name, description, category):
+        self._kill(product_id)
+        frequencies = {}
+        length = 0
+        for text, weight in zip((name, description, category), FIELD_WEIGHTS):
+            for term in tokenize(text):
+                frequencies[term] = frequencies.get(term, 0) + weight
+                length += weight
+
+        slot = len(self._ids)
+        self._ids.append(product_id)
+        self._lengths.append(length)
+        self._norms.append(self._norm(length))
+        self._categories.append(self._category_code(category or ''))
+        self._live.append(1)
+        self._slots[product_id] = slot
+        self._total_length += length
+        for term, frequency in frequencies.items():
+            slots, counts = self._postings[self._term_id(term)]
+            slots.append(slot)
+            counts.append(min(frequency, 0xFFFF))
+
+    def _compact(self):
+        # Renumber the live slots and drop the dead ones from every posting
+        renumbered = array('i', [-1]) * len(self._ids)
+        ids = []
+        lengths = array('I')
+        categories = array('H')
+        for slot, product_id in enumerate(self._ids):
+            if self._live[slot]:
+                renumbered[slot] = len(ids)
+                ids.append(product_id)
+                lengths.append(self._lengths[slot])
+                categories.append(self._categories[slot])
+        for term_id, (slots, counts) in enumerate(self._postings):
+            new_slots, new_counts = array('I'), array('H')
+            for slot, count in zip(slots, counts):
+                if renumbered[slot] >= 0:
+                    new_slots.append(renumbered[slot])
+                    new_counts.append(count)
+            self._postings[term_id] = (new_slots, new_counts)
+        self._ids = ids
+        self._lengths = lengths
+        self._categories = categories
+        self._live = bytearray(b'\x01') * len(ids)
+        self._slots = {product_id: slot for slot, product_id in enumerate(ids)}
+        self._dead = 0
+        self._renorm()
+
+    def _maybe_compact(self):
+        if self._dead > 1000 and self._dead > COMPACT_RATIO * len(self._ids):
+            self._compact()
+
+    def build(self, documents):
+        """Replace the index with documents: (id, name, description, category).
+        Searches keep using the old index until the new one is complete."""
+        fresh = SearchEngine()
+        for document in documents:
+            fresh._add(*document)
+        fresh._renorm()
+        with self._lock:
+            lock = self._lock
+            self.__dict__.update(fresh.__dict__)
+            self._lock = lock
+            self.ready = True
+
+    def update(self, documents, removed=()):
+        """Add or replace documents and remove the products in removed."""
+        with self._lock:
+            for product_id in removed:
+                self._kill(product_id)
+            for document in documents:
+                self._add(*document)
+            self._maybe_compact()
+
+    def _expand(self, token):
+        # (term id, weight) for the exact term and, if it isn't in the
+        # vocabulary, the terms within max_edits of it
+        term_id = self._term_ids.get(token)
+        if term_id is not None:
+            return [(term_id, 1.0)]
+        if len(token) < FUZZY_MIN_LENGTH:
+            return []
+        limit = max_edits(token)
+        grams = trigrams(token)
+        # An edit changes at most three trigrams
+        needed = max(1, len(grams) - 3 * limit)
+        shared = {}
+        for trigram in grams:
+            for candidate in self._trigrams.get(trigram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        expansions = []
+        for candidate, count in shared.items():
+            if count >= needed:
+                distance = edit_distance(token, self._terms[candidate], limit)
+                if distance <= limit:
+                    expansions.append((candidate, FUZZY_PENALTY ** distance))
+        return expansions
+
+    def search(self, text, category=None, offset=0, limit=10):
+        """Return (total, product ids) for the products matching every word
+        of text, best first, skipping the first offset."""
+        tokens = list(dict.fromkeys(tokenize(text)))
+        if not tokens:
+            return 0, []
+        with self._lock:
+            live = len(self._ids) - self._dead
+            if not live:
+                return 0, []
+            if category is not None:
+                category_code = self._category_codes.get(category)
+                if category_code is None:
+                    return 0, []
+            norms = self._norms
+            alive = self._live
+            all_alive = not self._dead
+
+            expanded = []
+            for token in tokens:
+                expansions = self._expand(token)
+                if not expansions:
+                    return 0, []
+                expanded.append((sum(len(self._postings[term_id][0]) for term_id, _ in expansions), expansions))
+            # Rarest word first, so later words only score its matches
+            expanded.sort(key=lambda item: item[0])
+
+            scores = None
+            for _, expansions in expanded:
+                token_scores = {}
+                for term_id, weight in expansions:
+                    slots, counts = self._postings[term_id]
+                    idf = math.log(1 + (live - len(slots) + 0.5) / (len(slots) + 0.5)) * weight * (BM25_K1 + 1)
+                    if scores is not None and len(scores) * 16 < len(slots):
+                        # Few candidates left: look each one up in the posting
+                        matches = []
+                        for slot in scores:
+                            index = bisect_left(slots, slot)
+                            if index < len(slots) and slots[index] == slot:
+                                matches.append((slot, counts[index]))
+                    elif scores is not None:
+                        matches = [(slot, count) for slot, count in zip(slots, counts) if slot in scores]
+                    else:
+                        matches = zip(slots, counts)
+                    for slot, count in matches:
+                        if not all_alive and not alive[slot]:
+                            continue
+                        score = idf * count / (count + norms[slot])
+                        # A word matched by several fuzzy terms counts once
+                        if score > token_scores.get(slot, 0.0):
+                            token_scores[slot] = score
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {slot: scores[slot] + score for slot, score in token_scores.items()}
+                if not scores:
+                    return 0, []
+
+            if category is not None:
+                categories = self._categories
+                scores = {slot: score for slot, score in scores.items() if categories[slot] == category_code}
+            best = heapq.nlargest(offset + limit, scores.items(), key=lambda item: (item[1], -item[0]))
+            return len(scores), [self._ids[slot] for slot, _ in best[offset:]]
+
+    def stats(self):
+        with self._lock:
+            posting_bytes = sum(slots.itemsize * len(slots) + counts.itemsize * len(counts)
+                                for slots, counts in self._postings)
+            trigram_bytes = sum(term_ids.itemsize * len(term_ids) for term_ids in self._trigrams.values())
+            return {
+                'ready': self.ready,
+                'documents': len(self._ids) - self._dead,
+                'dead_slots': self._dead,
+                'terms': len(self._terms),
+                'trigrams': len(self._trigrams),
+                'posting_bytes': posting_bytes,
+                'trigram_bytes': trigram_bytes
+            }
+
+
+class SearchEngineSync:
+    """Keeps a SearchEngine current in every replica.
+
+    load(product_ids=None) returns the documents of those products, or of
+    every product, from the database. changed() reloads products in this
+    replica and publishes their ids; the listener reloads them in the others.
+    """
+
+    def __init__(self, engine, client, load, channel=SEARCH_ENGINE_CHANNEL):
+        self.engine = engine
+        self.client = client
+        self.load = load
+        self.channel = channel
+        # Lets the listener skip what this replica published itself
+        self.origin = uuid.uuid4().hex
+        self._thread = None
+        # Products changed while a build is loading, reloaded after it
+        self._pending = None
+        self._pending_lock = threading.Lock()
+
+    def reload(self, product_ids):
+        product_ids = list(product_ids)
+        with self._pending_lock:
+            if self._pending is not None:
+                self._pending.update(product_ids)
+        documents = list(self.load(product_ids))
+        found = {document[0] for document in documents}
+        self.engine.update(documents, [product_id for product_id in product_ids if product_id not in found])
+
+    def rebuild(self):
+        with self._pending_lock:
+            self._pending = set()
+        try:
+            self.engine.build(self.load())
+        finally:
+            with self._pending_lock:
+                pending, self._pending = self._pending, None
+        if pending:
+            self.reload(pending)
+
+    def changed(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        try:
+            self.reload(product_ids)
+        except Exception as e:
+            print(f"Error updating search index: {str(e)}")
+        try:
+            self.client.publish(self.channel, json.dumps({'origin': self.origin, 'ids': product_ids}))
+        except redis.RedisError as e:
+            print(f"Error publishing search index update: {str(e)}")
+
+    def _listen(self):
+        subscribed_before = False
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # Updates sent while not subscribed are lost
+                if subscribed_before:
+                    self.rebuild()
+                subscribed_before = True
+                for message in pubsub.listen():
+                    if message['type'] != 'message':
+                        continue
+                    update = json.loads(message['data'])
+                    if update.get('origin') != self.origin:
+                        self.reload(update.get('ids', ()))
+            except Exception as e:
+                print(f"Error in search index listener: {str(e)}")
+                time.sleep(1)
+
+    def _run(self):
+        while True:
+            start = time.perf_counter()
+            try:
+                self.rebuild()
+                break
+            except Exception as e:
+                print(f"Error building search index: {str(e)}")
+                time.sleep(5)
+        print(f"Search index built in {time.perf_counter() - start:.1f}s: {self.engine.stats()['documents']} products")
+        self._listen()
+
+    def start(self):
+        """Build the index and follow updates, from a background thread.
+        Searches fall back to the database until the index is ready."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='search-index', daemon=True)
+            self._thread.start()
+
+
+def create_search_engine(client, load):
+    if not SEARCH_ENGINE_ENABLED:
+        return None
+    return SearchEngineSync(SearchEngine(), client, load)
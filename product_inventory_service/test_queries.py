@@ -0,0 +1,73 @@
+import os
+import tempfile
+
+import fakeredis
+import pytest
+
+os.environ.setdefault('METRICS_ENABLED', 'false')
+os.environ.setdefault('TRACING_ENABLED', 'false')
+os.environ.setdefault('CACHE_LOCAL_ENABLED', 'false')
+os.environ.setdefault('SEARCH_ENGINE_ENABLED', 'false')
+os.environ.setdefault('RESERVATION_SWEEP_ENABLED', 'false')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test_queries.db'))
+
+import app as service
+from query_count import assert_max_queries
+
+# Query count budget of the product endpoints: a listing must not run more
+# queries as its page grows (no lazy load per product). A test over budget
+# fails with the statements the endpoint ran.
+#
+#   pip install pytest fakeredis && python -m pytest test_queries.py
+
+PRODUCTS = 50
+
+# (path, query string, most queries allowed on a cache miss)
+CHECKS = [
+    ('/api/products', {'per_page': PRODUCTS}, 2),                        # count and page
+    ('/api/products', {'per_page': PRODUCTS, 'category': 'Books'}, 3),   # + category lookup
+    ('/api/products', {'per_page': PRODUCTS, 'search': 'gadget'}, 2),
+    ('/api/products', {'per_page': PRODUCTS, 'sort': 'price_high'}, 2),
+    ('/api/products', {'per_page': PRODUCTS, 'cursor': ''}, 1),
+    ('/api/products', {'per_page': PRODUCTS, 'cursor': '', 'total': 'exact'}, 2),
+    ('/api/categories', {}, 1)
+]
+
+
+@pytest.fixture(scope='module')
+def product_id():
+    service.response_cache.client = fakeredis.FakeRedis()
+    # The app created the tables and the search index on import
+    with service.app.app_context():
+        names = ['Electronics', 'Clothing', 'Home & Kitchen', 'Books', 'Toys']
+        for name in names:
+            service.db.session.add(service.Category(id=name, name=name))
+        for i in range(PRODUCTS):
+            service.db.session.add(service.Product(
+                name=f"Gadget {i:03d}",
+                description='A useful gadget',
+                price=5.0 + i,
+                stock=10,
+                category_id=names[i % len(names)]
+            ))
+        service.db.session.commit()
+        return service.Product.query.first().id
+
+
+def check(path, query_string, limit, product_id):
+    # Start from a miss; a cached response runs no queries at all
+    service.response_cache.invalidate(namespaces=['products'], keys=['categories', f"product:{product_id}"])
+    with service.app.app_context():
+        engine = service.db.engine
+    with assert_max_queries(limit, engine, f"GET {path} {query_string}"):
+        response = service.app.test_client().get(path, query_string=query_string)
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('path, query_string, limit', CHECKS)
+def test_listing_queries(product_id, path, query_string, limit):
+    check(path, query_string, limit, product_id)
+
+
+def test_product_queries(product_id):
+    check(f"/api/products/{product_id}", {}, 1, product_id)
@@ -0,0 +1,79 @@
+import os
+import tempfile
+
+import fakeredis
+import pytest
+
+os.environ.setdefault('METRICS_ENABLED', 'false')
+os.environ.setdefault('TRACING_ENABLED', 'false')
+os.environ.setdefault('CACHE_LOCAL_ENABLED', 'false')
+os.environ.setdefault('SEARCH_ENGINE_ENABLED', 'false')
+os.environ.setdefault('RESERVATION_SWEEP_ENABLED', 'false')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test_search.db'))
+
+import app as service
+from search_engine import SearchEngine, SearchEngineSync
+
+# A relevance ranked search gives the same products, totals and pages from
+# the in-memory search engine as from the database, whatever the filters.
+# The two rank differently, so every case fits on one page, and only the
+# engine matches typos, so no query word is a few edits from another word.
+#
+#   pip install pytest fakeredis && python -m pytest test_search.py
+
+PRODUCTS = [
+    ('Zephyr lantern', 'Rechargeable camping light', 'Outdoor'),
+    ('Brass lantern', 'Hanging light for the porch', 'Lighting'),
+    ('Paper lantern', 'Folding party decoration', 'Lighting'),
+    ('Zephyr kettle', 'Stove top kettle', 'Outdoor')
+]
+
+# query string of GET /api/products
+CASES = [
+    {'search': 'lantern'},
+    {'search': 'lantern light'},
+    {'search': 'zephyr', 'category': 'Outdoor'},
+    {'search': 'lantern', 'category': 'Lighting'},
+    {'search': 'lantern', 'category': 'Unlisted'},     # unknown category
+    {'search': 'lantern', 'category': 'Empty'},        # category without products
+    {'search': 'lantern', 'page': 0},
+    {'search': 'lantern', 'per_page': 0},
+    {'search': 'xylophone'}
+]
+
+
+@pytest.fixture(scope='module')
+def engine():
+    service.response_cache.client = fakeredis.FakeRedis()
+    # The app created the tables and the search index on import
+    with service.app.app_context():
+        categories = {}
+        for name in ('Outdoor', 'Lighting', 'Empty'):
+            categories[name] = service.Category(name=name)
+            service.db.session.add(categories[name])
+        for name, description, category in PRODUCTS:
+            service.db.session.add(service.Product(name=name, description=description, price=20.0, stock=5,
+                                                   category=categories[category]))
+        service.db.session.commit()
+    sync = SearchEngineSync(SearchEngine(), service.response_cache.client, service.search_documents)
+    sync.rebuild()
+    return sync
+
+
+def products(query_string, search_engine):
+    service.search_engine = search_engine
+    try:
+        service.response_cache.invalidate(namespaces=['products'])
+        response = service.app.test_client().get('/api/products', query_string=query_string)
+    finally:
+        service.search_engine = None
+    assert response.status_code == 200
+    result = response.get_json()
+    result['items'] = sorted(item['id'] for item in result['items'])
+    return result
+
+
+@pytest.mark.parametrize('query_string', CASES)
+def test_engine_matches_database(engine, query_string):
+    assert engine.engine.ready
+    assert products(query_string, engine) == products(query_string, None)